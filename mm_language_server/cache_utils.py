@@ -0,0 +1,132 @@
+"""Utilities to cache expensive language server results.
+
+Caches are bounded and keep hit/miss counters so that their efficiency
+can be inspected at runtime.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+_CACHES: Dict[str, "LRUCache"] = {}
+
+
+class LRUCache(Generic[K, V]):
+    """A thread safe, bounded least-recently-used cache.
+
+    If `max_age` is given, items older than so many seconds are dropped
+    too. Every cache is registered by name so that `cache_stats` can
+    report all of them at once.
+    """
+
+    def __init__(self, name: str, maxsize: int = 128, max_age: Optional[float] = None) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[K, V]" = OrderedDict()
+        self._times: Dict[K, float] = {}
+        self._lock = threading.RLock()
+        _CACHES[name] = self
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        """Return the cached value of `key`, counting hits and misses."""
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if self._expired(key, time.monotonic()):
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: K, value: V) -> None:
+        """Cache `value` for `key`, dropping the least recently used item."""
+        with self._lock:
+            now = time.monotonic()
+            if self.max_age is not None:
+                for expired in [k for k in self._data if self._expired(k, now)]:
+                    self._remove(expired)
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._times[key] = now
+            while len(self._data) > self.maxsize:
+                self._remove(next(iter(self._data)))
+
+    def items(self) -> List[Tuple[K, V]]:
+        """Return all items, without counting them as hits or refreshing them."""
+        with self._lock:
+            return list(self._data.items())
+
+    def evict(self, predicate: Callable[[K], bool]) -> int:
+        """Remove all items whose key matches `predicate`.
+
+        Returns the number of removed items.
+        """
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self) -> None:
+        """Remove all items and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self._times.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def _expired(self, key: K, now: float) -> bool:
+        return self.max_age is not None and now - self._times[key] > self.max_age
+
+    def _remove(self, key: K) -> None:
+        del self._data[key]
+        del self._times[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the size and hit/miss counters of the cache."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def cache_home() -> Path:
+    """Get the directory where the language server persists its caches."""
+    cache_home_ = os.getenv("XDG_CACHE_HOME") or os.path.join("~", ".cache")
+    return Path(cache_home_).expanduser() / "mm-language-server"
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Return the statistics of all registered caches."""
+    return {name: cache.stats() for name, cache in sorted(_CACHES.items())}
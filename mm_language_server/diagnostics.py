@@ -0,0 +1,52 @@
+"""Diagnostics of documents, cached for the pull model.
+
+Diagnostics are computed by `config_checks`, which identifies every
+result by the content hashes of the document and of its `_base_`
+configs. A client sending the id of its last result back gets an
+"unchanged" report without anything being checked again.
+"""
+
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping, Optional
+
+from jedi import Project
+from pygls.workspace import Document
+
+from . import parso_utils
+from .config_checks import CONFIG_CHECKER, CheckResult
+from .worker import check_cancelled
+
+
+def open_sources(documents: Iterable[Document]) -> Dict[str, str]:
+    """Get the contents of open documents by normalized path."""
+    return {os.path.normpath(os.path.abspath(document.path)): document.source for document in documents}
+
+
+def diagnose(project: Optional[Project], document: Document, scope: str,
+             sources: Mapping[str, str]) -> Optional[CheckResult]:
+    """Get the diagnostics of a document.
+
+    Open documents are checked from their cached parso module. Returns
+    None if the file doesn't exist.
+    """
+    path = Path(document.path).absolute()
+    if document.version is None:
+        return CONFIG_CHECKER.check(str(path), scope, sources)
+    module = (parso_utils.get_grammar(project, path), parso_utils.parse(project, document))
+    return CONFIG_CHECKER.check(str(path), scope, {**sources, **open_sources([document])}, module)
+
+
+def diagnose_many(paths: List[str], scope: str, sources: Mapping[str, str]) -> Dict[str, CheckResult]:
+    """Get the diagnostics of many files by path.
+
+    The files whose content changed are parsed in a process pool.
+    """
+    CONFIG_CHECKER.scan(paths, sources)
+    results = {}
+    for path in paths:
+        check_cancelled()
+        result = CONFIG_CHECKER.check(path, scope, sources)
+        if result is not None:
+            results[path] = result
+    return results
@@ -32,6 +32,10 @@ class CodeAction(Model):
 class Completion(Model):
     disable_snippets: bool = False
     resolve_eagerly: bool = False
+    # Only the top ranked items are resolved eagerly, within a time budget
+    # in seconds. The others are resolved by completionItem/resolve.
+    resolve_eagerly_limit: int = 50
+    resolve_eagerly_budget: float = 0.25
     ignore_patterns: List[Pattern] = []
 
 
@@ -40,6 +44,9 @@ class Diagnostics(Model):
     did_open: bool = True
     did_save: bool = True
     did_change: bool = True
+    # Seconds to wait after the last didChange of a document before
+    # computing its diagnostics.
+    debounce: float = 0.3
 
 
 class HoverDisableOptions(Model):
@@ -78,6 +85,10 @@ class JediSettings(Model):
     debug: bool = False
 
 
+class Registry(Model):
+    static_scan: bool = False
+
+
 class Symbols(Model):
     ignore_folders: List[str] = [".nox", ".tox", ".venv", "__pycache__"]
     max_symbols: int = 20
@@ -95,5 +106,6 @@ class InitializationOptions(Model):
     hover: Hover = Hover()
     jedi_settings: JediSettings = JediSettings()
     markup_kind_preferred: Optional[MarkupKind]
+    registry: Registry = Registry()
     workspace: Workspace = Workspace()
     scope: str = "mmengine"
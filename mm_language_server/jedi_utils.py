@@ -3,36 +3,64 @@
 Translates pygls types back and forth with Jedi
 """
 
+import hashlib
+import itertools
+import os
 import sys
-from inspect import Parameter
-from typing import Dict, Iterator, List, Optional, Tuple
+import time
+from inspect import Parameter, _ParameterKind
+from pathlib import Path
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 import docstring_to_markdown
-import jedi.api.errors
+import jedi.api.helpers
 import jedi.inference.references
 import jedi.settings
 from jedi import Project, Script
 from jedi.api.classes import BaseName, Completion, Name, ParamName, Signature
+from parso.python.tree import Name as ParsoName
+from parso.tree import BaseNode, NodeOrLeaf
 from pygls.lsp.types import (
     CompletionItem,
     CompletionItemKind,
-    Diagnostic,
-    DiagnosticSeverity,
+    DocumentHighlight,
+    DocumentHighlightKind,
     DocumentSymbol,
     InsertTextFormat,
     Location,
     MarkupContent,
     MarkupKind,
+    NumType,
+    ParameterInformation,
     Position,
     Range,
+    SignatureHelp,
+    SignatureInformation,
     SymbolInformation,
     SymbolKind,
+    TextEdit,
 )
 from pygls.workspace import Document
 
+from .cache_utils import LRUCache
 from .initialization_options import HoverDisableOptions, InitializationOptions
-from .mm_jedi import MMScript
+from .mm_jedi import BASE_GRAPH, MMScript, find_base_files
+from .parso_utils import parse
+from .registry_index import RegistryEntry
 from .type_map import get_lsp_completion_type, get_lsp_symbol_type
+from .worker import check_cancelled
+from .workspace_index import WorkspaceIndex, WorkspaceSymbol
 
 
 def _jedi_debug_function(
@@ -57,9 +85,138 @@ def set_jedi_settings(  # pylint: disable=invalid-name
         jedi.set_debug_function(func_cb=_jedi_debug_function)
 
 
+_WORKSPACE_INDEX: Optional[WorkspaceIndex] = None
+
+
+def use_workspace_index(workspace_index: Optional[WorkspaceIndex]) -> None:
+    """Search references only in the files of the workspace index which use
+    the searched name, instead of grepping the whole project."""
+    global _WORKSPACE_INDEX  # pylint: disable=global-statement
+    _WORKSPACE_INDEX = workspace_index
+
+
+def _reference_paths(project_path: Path, script_path: Optional[Path], name: str) -> Optional[Iterator[str]]:
+    """Get the files using a name from the workspace index, see
+    `MMScript.reference_paths`.
+
+    The configs inheriting from the script come first, then the other
+    files by how close they are to the script in the directory tree.
+    None while the index is being built, or for projects other than the
+    workspace, so that jedi searches them.
+    """
+    workspace_index = _WORKSPACE_INDEX
+    if workspace_index is None or os.path.abspath(project_path) != workspace_index.root:
+        return None
+    paths = workspace_index.files_containing(name)
+    if paths is None:
+        return None
+    if script_path is None:
+        return _searched_paths(sorted(paths))
+    descendants = [path for path in workspace_index.descendants(str(script_path)) or [] if path in paths]
+    directory = Path(script_path).parent.parts
+    others = sorted(paths.difference(descendants), key=lambda path: (_tree_distance(directory, path), path))
+    return _searched_paths(descendants + others)
+
+
+def _tree_distance(directory: Tuple[str, ...], path: str) -> int:
+    """Count the directories between a directory and a file."""
+    parts = Path(path).parent.parts
+    common = len(os.path.commonprefix([directory, parts]))
+    return len(directory) + len(parts) - 2 * common
+
+
+def _searched_paths(paths: List[str]) -> Iterator[str]:
+    for path in paths:
+        # Searching a file is a safe point to stop a cancelled reference search.
+        check_cancelled()
+        yield path
+
+
+_SCRIPT_CACHE: LRUCache[Tuple[str, NumType, Optional[str]], MMScript] = LRUCache("script", maxsize=32)
+
+
 def script(project: Optional[Project], document: Document, scope=None) -> Script:
-    """Simplifies getting jedi Script."""
-    return MMScript(code=document.source, path=document.path, project=project, scope=scope)
+    """Simplifies getting jedi Script.
+
+    Scripts of opened documents are cached by (uri, version, scope), so
+    all handlers working on the same document version share one parse.
+    Their parso module is reused from `parso_utils.parse`, which is
+    updated incrementally on every didChange. Documents without a
+    version (not opened by the client) are never cached because their
+    content may change on disk.
+    """
+    if document.version is None:
+        return MMScript(
+            code=document.source,
+            path=document.path,
+            project=project,
+            scope=scope,
+            reference_paths=_reference_paths,
+        )
+
+    key = (document.uri, document.version, scope)
+    module = parse(project, document)
+    jedi_script = _SCRIPT_CACHE.get(key)
+    # The module is parsed again if jedi changed it, see `parso_utils`.
+    if jedi_script is None or jedi_script._module_node is not module:  # pylint: disable=protected-access
+        # Scripts of older versions can never be hit again.
+        _SCRIPT_CACHE.evict(lambda k: k[0] == document.uri and k[1] != document.version)
+        jedi_script = MMScript(
+            path=document.path,
+            project=project,
+            scope=scope,
+            module_node=module,
+            reference_paths=_reference_paths,
+        )
+        _SCRIPT_CACHE.put(key, jedi_script)
+    return jedi_script
+
+
+def evict_script(uri: str) -> None:
+    """Remove all cached results of a document, e.g. when it is closed."""
+    _SCRIPT_CACHE.evict(lambda key: key[0] == uri)
+    _SIGNATURES.evict(lambda key: key[0] == uri)
+    _DOCUMENT_SYMBOLS.evict(lambda key: key[0] == uri)
+    _HOVER_NAMES.evict(lambda key: key[0] == uri)
+    _HOVER_TEXTS.evict(lambda key: key[0] == uri)
+
+
+def _dependencies(jedi_script: MMScript) -> Set[str]:
+    """Get the files a script has read so far: the modules it imported and
+    its `_base_` configs."""
+    paths = set()
+    # pylint: disable=protected-access
+    for values in jedi_script._inference_state.module_cache._name_cache.values():
+        for value in values:
+            path = value.py__file__()
+            if path is not None:
+                paths.add(os.path.normpath(path))
+    if jedi_script.path is not None:
+        base_files = find_base_files(jedi_script._module_node, jedi_script.path.parent)
+        paths.update(str(config.path) for config in BASE_GRAPH.ancestors(base_files))
+    return paths
+
+
+def evict_scripts(paths: Iterable[str], created: bool = False) -> None:
+    """Remove the cached scripts which read files changed on disk, and the
+    results inferred with them.
+
+    The results of a changed file's own document are kept, they only
+    depend on its version. A created file can be imported by any script
+    which failed to import it before, so all scripts are removed then.
+    Document symbols only depend on the document itself, so they are
+    always kept.
+    """
+    changed = {os.path.normpath(os.path.abspath(path)) for path in paths}
+    stale = {
+        key[:2]
+        for key, jedi_script in _SCRIPT_CACHE.items()
+        if (jedi_script.path is not None and os.path.normpath(os.path.abspath(jedi_script.path)) not in changed and (
+            created or not changed.isdisjoint(_dependencies(jedi_script))))
+    }
+    _SCRIPT_CACHE.evict(lambda key: key[:2] in stale)
+    _SIGNATURES.evict(lambda key: key[:2] in stale)
+    _HOVER_NAMES.evict(lambda key: key[:2] in stale)
 
 
 def lsp_range(name: Name) -> Optional[Range]:
@@ -85,6 +242,18 @@ def lsp_range(name: Name) -> Optional[Range]:
     )
 
 
+def lsp_document_highlight(name: ParsoName, is_definition: bool) -> DocumentHighlight:
+    """Get LSP document highlight from a parso name."""
+    line, column = name.start_pos
+    return DocumentHighlight(
+        range=Range(
+            start=Position(line=line - 1, character=column),
+            end=Position(line=line - 1, character=column + len(name.value)),
+        ),
+        kind=DocumentHighlightKind.Write if is_definition else DocumentHighlightKind.Read,
+    )
+
+
 def lsp_location(name: Name) -> Optional[Location]:
     """Get LSP location from Jedi definition."""
     module_path = name.module_path
@@ -112,6 +281,22 @@ def lsp_symbol_information(name: Name) -> Optional[SymbolInformation]:
     )
 
 
+def lsp_workspace_symbol(symbol: WorkspaceSymbol) -> SymbolInformation:
+    """Get LSP SymbolInformation from a workspace index symbol."""
+    return SymbolInformation(
+        name=symbol.name,
+        kind=get_lsp_symbol_type(symbol.kind),
+        location=Location(
+            uri=Path(symbol.path).as_uri(),
+            range=Range(
+                start=Position(line=symbol.line - 1, character=symbol.column),
+                end=Position(line=symbol.line - 1, character=symbol.column + len(symbol.name)),
+            ),
+        ),
+        container_name=symbol.full_name,
+    )
+
+
 def _document_symbol_range(name: Name) -> Optional[Range]:
     """Get accurate full range of function.
 
@@ -200,19 +385,110 @@ def lsp_document_symbols(names: List[Name]) -> List[DocumentSymbol]:
     return results
 
 
-def lsp_diagnostic(error: jedi.api.errors.SyntaxError) -> Diagnostic:
-    """Get LSP Diagnostic from Jedi SyntaxError."""
-    return Diagnostic(
-        range=Range(
-            start=Position(line=error.line - 1, character=error.column),
-            end=Position(line=error.until_line - 1, character=error.until_column),
-        ),
-        message=error.get_message(),
-        severity=DiagnosticSeverity.Error,
-        source="jedi",
+Symbol = Union[DocumentSymbol, SymbolInformation]
+
+
+class _StatementSymbols(NamedTuple):
+    """Symbols of a top-level statement which started at `line`."""
+
+    line: int
+    symbols: List[Symbol]
+
+
+class _DocumentSymbols(NamedTuple):
+    version: Optional[NumType]
+    statements: Dict[str, _StatementSymbols]
+    symbols: List[Symbol]
+
+
+_DOCUMENT_SYMBOLS: LRUCache[Tuple[str, bool], _DocumentSymbols] = LRUCache("document_symbol", maxsize=16)
+
+
+def _shift_range(range_: Range, offset: int) -> Range:
+    return Range(
+        start=Position(line=range_.start.line + offset, character=range_.start.character),
+        end=Position(line=range_.end.line + offset, character=range_.end.character),
     )
 
 
+def _shift_symbol(symbol: Symbol, offset: int) -> Symbol:
+    """Move a symbol and its children down by `offset` lines."""
+    if isinstance(symbol, SymbolInformation):
+        location = Location(uri=symbol.location.uri, range=_shift_range(symbol.location.range, offset))
+        return symbol.copy(update={"location": location})
+    return symbol.copy(
+        update={
+            "range": _shift_range(symbol.range, offset),
+            "selection_range": _shift_range(symbol.selection_range, offset),
+            "children": [_shift_symbol(child, offset) for child in symbol.children or []],
+        })
+
+
+def _statement_names(script_: Script, statement: BaseNode) -> List[Name]:
+    """Get the names defined in a top-level statement, like
+    `Script.get_names(all_scopes=True, definitions=True)` does for the
+    whole module."""
+    # pylint: disable=protected-access
+    module_context = script_._get_module_context()
+    names = []
+    nodes: List[NodeOrLeaf] = [statement]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, ParsoName):
+            if node.is_definition():
+                names.append(Name(script_._inference_state, module_context.create_name(node)))
+        elif isinstance(node, BaseNode):
+            nodes.extend(reversed(node.children))
+    return names
+
+
+def _statement_symbols(script_: Script, statement: BaseNode, hierarchical: bool) -> List[Symbol]:
+    names = _statement_names(script_, statement)
+    if hierarchical:
+        return list(lsp_document_symbols(names))
+    return [
+        symbol_info for symbol_info in (lsp_symbol_information(name) for name in names if name.type != "param")
+        if symbol_info is not None
+    ]
+
+
+def cached_document_symbols(script_: Script, document: Document, hierarchical: bool) -> List[Symbol]:
+    """Get the symbols of a document, hierarchically or not.
+
+    Symbols are cached per document version and computed per top-level
+    statement. When the document changes, only the statements whose code
+    changed are recomputed; the symbols of the others are moved to their
+    new lines.
+    """
+    key = (document.uri, hierarchical)
+    cached = _DOCUMENT_SYMBOLS.get(key) if document.version is not None else None
+    if cached is not None and cached.version == document.version:
+        return cached.symbols
+
+    previous = cached.statements if cached is not None else {}
+    statements: Dict[str, _StatementSymbols] = {}
+    symbols: List[Symbol] = []
+    # pylint: disable=protected-access
+    for statement in script_._module_node.children:
+        if statement.type == "endmarker":
+            continue
+        check_cancelled()
+        code = statement.get_code(include_prefix=False)
+        line = statement.start_pos[0]
+        statement_symbols = statements.get(code) or previous.get(code)
+        if statement_symbols is None:
+            statement_symbols = _StatementSymbols(line, _statement_symbols(script_, statement, hierarchical))
+        statements[code] = statement_symbols
+        if statement_symbols.line == line:
+            symbols.extend(statement_symbols.symbols)
+        else:
+            symbols.extend(_shift_symbol(symbol, line - statement_symbols.line) for symbol in statement_symbols.symbols)
+
+    if document.version is not None:
+        _DOCUMENT_SYMBOLS.put(key, _DocumentSymbols(document.version, statements, symbols))
+    return symbols
+
+
 def line_column(position: Position) -> Tuple[int, int]:
     """Translate pygls Position to Jedi's line/column.
 
@@ -358,23 +634,51 @@ _LSP_TYPE_FOR_SNIPPET = {
     CompletionItemKind.Function,
 }
 
-_MOST_RECENT_COMPLETIONS: Dict[str, Completion] = {}
+# Completions of the most recent requests, for completionItem/resolve.
+# Every request gets an id which is sent to the client in the `data` of
+# its completion items, so that resolving stays correct while newer
+# completion requests come in.
+_COMPLETIONS: LRUCache[int, List[Completion]] = LRUCache("completion", maxsize=8, max_age=600.0)
+_COMPLETION_IDS = itertools.count()
 
 
-def clear_completions_cache() -> None:
-    """Clears the cache of completions used for completionItem/resolve."""
-    _MOST_RECENT_COMPLETIONS.clear()
+def cache_completions(completions: List[Completion]) -> int:
+    """Cache the completions of a request for completionItem/resolve.
 
+    Returns the id of the request.
+    """
+    completion_id = next(_COMPLETION_IDS)
+    _COMPLETIONS.put(completion_id, completions)
+    return completion_id
+
+
+def _cached_completion(data: Any) -> Optional[Completion]:
+    """Get the cached completion of the `data` of a completion item."""
+    if not isinstance(data, dict):
+        return None
+    completion_id, index = data.get("completionId"), data.get("index")
+    if not isinstance(completion_id, int) or not isinstance(index, int):
+        return None
+    completions = _COMPLETIONS.get(completion_id)
+    if completions is None or not 0 <= index < len(completions):
+        return None
+    return completions[index]
 
-def lsp_completion_item(  # pylint: disable=too-many-arguments
+
+def lsp_completion_item(
     completion: Completion,
     char_before_cursor: str,
     enable_snippets: bool,
-    resolve_eagerly: bool,
-    markup_kind: MarkupKind,
     sort_append_text: str = "",
+    data: Optional[Dict[str, int]] = None,
 ) -> CompletionItem:
-    """Using a Jedi completion, obtain a jedi completion item."""
+    """Using a Jedi completion, obtain a jedi completion item.
+
+    Its documentation is filled in later, by `lsp_completion_item_resolve`
+    or `lsp_completion_items_resolve`.
+    `data` identifies the completion in the cache filled by
+    `cache_completions`.
+    """
     completion_name = completion.name
     name_clean = clean_completion_name(completion_name, char_before_cursor)
     lsp_type = get_lsp_completion_type(completion.type)
@@ -385,12 +689,9 @@ def lsp_completion_item(  # pylint: disable=too-many-arguments
         sort_text=complete_sort_name(completion, sort_append_text),
         insert_text=name_clean,
         insert_text_format=InsertTextFormat.PlainText,
+        data=data,
     )
 
-    _MOST_RECENT_COMPLETIONS[completion_name] = completion
-    if resolve_eagerly:
-        completion_item = lsp_completion_item_resolve(completion_item, markup_kind=markup_kind)
-
     if not enable_snippets:
         return completion_item
     if lsp_type not in _LSP_TYPE_FOR_SNIPPET:
@@ -410,6 +711,34 @@ def lsp_completion_item(  # pylint: disable=too-many-arguments
     return completion_item
 
 
+_REGISTRY_KIND_MAP = {
+    "class": CompletionItemKind.Class,
+    "function": CompletionItemKind.Function,
+}
+
+
+def lsp_registry_completion_item(entry: RegistryEntry, prefix: str, position: Position) -> CompletionItem:
+    """Get a completion item of a registry key in a ``type='...'`` string.
+
+    The item replaces the already typed `prefix` before `position`.
+    """
+    return CompletionItem(
+        label=entry.key,
+        filter_text=entry.key,
+        kind=_REGISTRY_KIND_MAP.get(entry.kind, CompletionItemKind.Class),
+        detail=f"{entry.module}.{entry.qualname}",
+        sort_text="v" + entry.key,
+        text_edit=TextEdit(
+            range=Range(
+                start=Position(line=position.line, character=position.character - len(prefix)),
+                end=position,
+            ),
+            new_text=entry.key,
+        ),
+        insert_text_format=InsertTextFormat.PlainText,
+    )
+
+
 def _md_bold(value: str, markup_kind: MarkupKind) -> str:
     """Add bold surrounding when markup_kind is markdown."""
     return f"**{value}**" if markup_kind == MarkupKind.Markdown else value
@@ -435,11 +764,15 @@ def _md_text_sl(value: str, markup_kind: MarkupKind) -> str:
     return f"`{value}`" if markup_kind == MarkupKind.Markdown else value
 
 
+_DOCSTRINGS: LRUCache[Tuple[bytes, MarkupKind], str] = LRUCache("docstring", maxsize=512)
+
+
 def convert_docstring(docstring: str, markup_kind: MarkupKind) -> str:
     """Take a docstring and convert it to markup kind if possible.
 
     Currently only supports markdown conversion; MarkupKind can only be
-    plaintext or markdown as of LSP 3.16.
+    plaintext or markdown as of LSP 3.16. Conversions to markdown are
+    cached by the hash of the docstring.
 
     NOTE: Since docstring_to_markdown is a new library, I add broad exception
     handling in case docstring_to_markdown.convert produces unexpected
@@ -449,18 +782,27 @@ def convert_docstring(docstring: str, markup_kind: MarkupKind) -> str:
     if docstring_stripped == "":
         return docstring_stripped
     if markup_kind == MarkupKind.Markdown:
-        try:
-            return docstring_to_markdown.convert(docstring_stripped).strip()
-        except docstring_to_markdown.UnknownFormatError:
-            return _md_text(docstring_stripped, markup_kind)
-        except Exception as error:  # pylint: disable=broad-except
-            result = (docstring_stripped + "\n" + "mm-language-server error: " +
-                      "Uncaught exception while converting docstring to markdown. " + "Please open issue at " +
-                      "https://github.com/mzr1996/mm-language-server/issues. " + f"Traceback:\n{error}").strip()
-            return _md_text(result, markup_kind)
+        key = (hashlib.sha1(docstring_stripped.encode("utf-8", "surrogatepass")).digest(), markup_kind)
+        result = _DOCSTRINGS.get(key)
+        if result is None:
+            result = _convert_to_markdown(docstring_stripped, markup_kind)
+            _DOCSTRINGS.put(key, result)
+        return result
     return docstring_stripped
 
 
+def _convert_to_markdown(docstring_stripped: str, markup_kind: MarkupKind) -> str:
+    try:
+        return docstring_to_markdown.convert(docstring_stripped).strip()
+    except docstring_to_markdown.UnknownFormatError:
+        return _md_text(docstring_stripped, markup_kind)
+    except Exception as error:  # pylint: disable=broad-except
+        result = (docstring_stripped + "\n" + "mm-language-server error: " +
+                  "Uncaught exception while converting docstring to markdown. " + "Please open issue at " +
+                  "https://github.com/mzr1996/mm-language-server/issues. " + f"Traceback:\n{error}").strip()
+        return _md_text(result, markup_kind)
+
+
 _SIGNATURE_TYPES = {"class", "function"}
 
 _SIGNATURE_TYPE_TRANSLATION = {
@@ -499,6 +841,84 @@ def signature_string(signature: Signature) -> str:
     return f"{name_type_trans} {signature.to_string()}"
 
 
+class _ParamName(NamedTuple):
+    """The name and kind of a parameter, all `CallDetails.calculate_index`
+    needs of jedi's parameter names, without keeping their inference
+    state and parso tree."""
+
+    string_name: str
+    kind: _ParameterKind
+
+    def get_kind(self) -> _ParameterKind:
+        return self.kind
+
+
+class _CallSignatures(NamedTuple):
+    """Signatures of the call of an opening bracket."""
+
+    signatures: List[SignatureInformation]
+    param_names: List[_ParamName]
+
+
+_SIGNATURES: LRUCache[Tuple[str, Optional[NumType], Tuple[int, int]], _CallSignatures] = LRUCache(
+    "signature", maxsize=64)
+
+
+def lsp_signature_help(
+    project: Optional[Project],
+    document: Document,
+    scope: Optional[str],
+    line: int,
+    column: int,
+    markup_kind: MarkupKind,
+) -> Optional[SignatureHelp]:
+    """Get the signature help of the call around a position.
+
+    Signatures are cached by the document version and the position of
+    the opening bracket of the call, so moving between the arguments of
+    a call only recomputes the active parameter. Any edit can change the
+    signature, e.g. of a function defined after the call, so signatures
+    are never reused across versions.
+    """
+    call_details = jedi.api.helpers.get_signature_details(parse(project, document), (line, column))
+    if call_details is None:
+        return None
+    bracket = call_details.bracket_leaf.end_pos
+    key = (document.uri, document.version, bracket)
+    cached = _SIGNATURES.get(key) if document.version is not None else None
+    if cached is None:
+        signatures_jedi = script(project, document, scope).get_signatures(line, column)
+        cached = _CallSignatures(
+            [
+                SignatureInformation(
+                    label=signature_string(signature),
+                    documentation=MarkupContent(
+                        kind=markup_kind,
+                        value=convert_docstring(signature.docstring(raw=True), markup_kind),
+                    ),
+                    parameters=[ParameterInformation(label=info.to_string()) for info in signature.params],
+                ) for signature in signatures_jedi
+            ],
+            [
+                _ParamName(param.string_name, param.get_kind())
+                # pylint: disable=protected-access
+                for param in (signatures_jedi[0]._signature.get_param_names(
+                    resolve_stars=True) if signatures_jedi else [])
+            ],
+        )
+        if document.version is not None:
+            # Signatures of older versions can never be hit again.
+            _SIGNATURES.evict(lambda k: k[0] == document.uri and k[1] != document.version)
+            _SIGNATURES.put(key, cached)
+    if not cached.signatures:
+        return None
+    return SignatureHelp(
+        signatures=cached.signatures,
+        active_signature=0,
+        active_parameter=call_details.calculate_index(cached.param_names),
+    )
+
+
 def _hover_ignore(name: Name, init: InitializationOptions) -> bool:
     """True if hover should be ignored, false otherwise.
 
@@ -549,12 +969,106 @@ def hover_text(
     return "\n".join(result).strip()
 
 
+_HOVER_NAMES: LRUCache[Tuple[str, NumType, int, int], List[Name]] = LRUCache("hover_name", maxsize=256)
+_HOVER_TEXTS: LRUCache[Tuple, str] = LRUCache("hover_text", maxsize=512)
+
+
+def help_names(script_: Script, document: Document, line: int, column: int) -> List[Name]:
+    """Get the names `Script.help` finds at a position of a document.
+
+    Names are cached by document version and position.
+    """
+    if document.version is None:
+        return script_.help(line=line, column=column)
+    key = (document.uri, document.version, line, column)
+    names = _HOVER_NAMES.get(key)
+    if names is None:
+        names = script_.help(line=line, column=column)
+        _HOVER_NAMES.evict(lambda k: k[0] == document.uri and k[1] != document.version)
+        _HOVER_NAMES.put(key, names)
+    return names
+
+
+def _hover_text_key(name: Name, document: Document, markup_kind: MarkupKind) -> Optional[Tuple]:
+    """Get the key of the hover text of a name.
+
+    Names defined in other modules are identified by their full name and
+    the modification time of their module, so that their hover text is
+    shared by all documents. Names defined in the document itself are
+    identified by their position in the document version.
+    """
+    full_name = name.full_name
+    module_path = name.module_path
+    is_local = module_path is not None and os.path.abspath(module_path) == os.path.abspath(document.path)
+    if full_name is None or is_local:
+        if document.version is None:
+            return None
+        return (document.uri, document.version, name.line, name.column, name.type, markup_kind)
+    try:
+        mtime = os.stat(module_path).st_mtime_ns if module_path is not None else None
+    except OSError:
+        mtime = None
+    return (full_name, str(module_path), mtime, name.type, markup_kind)
+
+
+def cached_hover_text(
+    names: List[Name],
+    document: Document,
+    markup_kind: MarkupKind,
+    initialization_options: InitializationOptions,
+) -> Optional[str]:
+    """Get a hover string from a list of names, reusing earlier results."""
+    if not names or _hover_ignore(names[0], initialization_options):
+        return None
+    key = _hover_text_key(names[0], document, markup_kind)
+    text = _HOVER_TEXTS.get(key) if key is not None else None
+    if text is None:
+        text = hover_text(names, markup_kind, initialization_options)
+        if key is not None and text is not None:
+            if key[0] == document.uri:
+                _HOVER_TEXTS.evict(lambda k: k[0] == document.uri and k[1] != document.version)
+            _HOVER_TEXTS.put(key, text)
+    return text
+
+
 def lsp_completion_item_resolve(
     item: CompletionItem,
     markup_kind: MarkupKind,
 ) -> CompletionItem:
-    """Resolve completion item using cached jedi completion data."""
-    completion = _MOST_RECENT_COMPLETIONS[item.label]
+    """Resolve completion item using cached jedi completion data.
+
+    Items whose completion isn't cached anymore are returned unchanged.
+    """
+    completion = _cached_completion(item.data)
+    if completion is None:
+        return item
+    return _resolve_completion_item(item, completion, markup_kind)
+
+
+def lsp_completion_items_resolve(
+    items: List[CompletionItem],
+    markup_kind: MarkupKind,
+    limit: int,
+    budget: float,
+) -> None:
+    """Resolve the top ranked completion items in place.
+
+    At most `limit` items are resolved, and no more once `budget`
+    seconds have passed. The others are left for completionItem/resolve.
+    """
+    deadline = time.monotonic() + budget
+    for item in sorted(items, key=lambda item: item.sort_text or item.label)[:limit]:
+        if time.monotonic() >= deadline:
+            break
+        check_cancelled()
+        lsp_completion_item_resolve(item, markup_kind=markup_kind)
+
+
+def _resolve_completion_item(
+    item: CompletionItem,
+    completion: Completion,
+    markup_kind: MarkupKind,
+) -> CompletionItem:
     item.detail = next(get_full_signatures(completion), completion.name)
     docstring = convert_docstring(completion.docstring(raw=True), markup_kind)
     item.documentation = MarkupContent(kind=markup_kind, value=docstring)
@@ -0,0 +1,115 @@
+"""LSP 3.17 types which pygls 0.12 doesn't know about.
+
+`install` registers the pull diagnostics methods with pygls, so that
+their parameters are parsed and their results are type checked like
+those of the built-in methods, and extends the capabilities which carry
+them.
+
+Specification:
+    https://microsoft.github.io/language-server-protocol/specifications/lsp/3.17/specification/#textDocument_diagnostic
+"""
+
+from typing import Any, Dict, List, Optional, Union, cast
+
+import pygls
+import pygls.lsp
+from pygls.lsp import types
+from pygls.lsp.methods import INITIALIZE
+from pygls.lsp.types import Diagnostic, Model, TextDocumentIdentifier
+
+TEXT_DOCUMENT_DIAGNOSTIC = "textDocument/diagnostic"
+WORKSPACE_DIAGNOSTIC = "workspace/diagnostic"
+
+
+class DiagnosticClientCapabilities(Model):
+    dynamic_registration: Optional[bool] = None
+    related_document_support: Optional[bool] = None
+
+
+class TextDocumentClientCapabilities(types.TextDocumentClientCapabilities):
+    diagnostic: Optional[DiagnosticClientCapabilities] = None
+
+
+class ClientCapabilities(types.ClientCapabilities):
+    text_document: Optional[TextDocumentClientCapabilities] = None
+
+
+class InitializeParams(types.InitializeParams):
+    capabilities: ClientCapabilities
+
+
+class DiagnosticOptions(Model):
+    identifier: Optional[str] = None
+    inter_file_dependencies: bool
+    workspace_diagnostics: bool
+
+
+class ServerCapabilities(types.ServerCapabilities):
+    diagnostic_provider: Optional[DiagnosticOptions] = None
+
+
+class DocumentDiagnosticParams(Model):
+    text_document: TextDocumentIdentifier
+    identifier: Optional[str] = None
+    previous_result_id: Optional[str] = None
+
+
+# pygls only sends the fields which were set, so always pass `kind`.
+class FullDocumentDiagnosticReport(Model):
+    kind: str = "full"
+    result_id: Optional[str] = None
+    items: List[Diagnostic]
+
+
+class UnchangedDocumentDiagnosticReport(Model):
+    kind: str = "unchanged"
+    result_id: str
+
+
+DocumentDiagnosticReport = Union[FullDocumentDiagnosticReport, UnchangedDocumentDiagnosticReport]
+
+
+class PreviousResultId(Model):
+    uri: str
+    value: str
+
+
+class WorkspaceDiagnosticParams(Model):
+    identifier: Optional[str] = None
+    previous_result_ids: List[PreviousResultId] = []
+
+
+class WorkspaceFullDocumentDiagnosticReport(FullDocumentDiagnosticReport):
+    uri: str
+    version: Optional[int] = None
+
+
+class WorkspaceUnchangedDocumentDiagnosticReport(UnchangedDocumentDiagnosticReport):
+    uri: str
+    version: Optional[int] = None
+
+
+WorkspaceDocumentDiagnosticReport = Union[WorkspaceFullDocumentDiagnosticReport,
+                                          WorkspaceUnchangedDocumentDiagnosticReport]
+
+
+class WorkspaceDiagnosticReport(Model):
+    items: List[WorkspaceDocumentDiagnosticReport]
+
+
+def install() -> None:
+    """Register the types above with pygls, which has to be done before the
+    server handles the initialize request.
+
+    Patches the global method table of pygls 0.12. Later versions are
+    based on lsprotocol, which has these types, and have no such table.
+    """
+    version = getattr(pygls, "__version__", "unknown")
+    if not version.startswith("0.12."):
+        raise RuntimeError(f"pygls 0.12 is required, found {version}")
+    # (registration options, params, result) like pygls' own entries.
+    cast(Dict[str, Any], pygls.lsp.LSP_METHODS_MAP).update({
+        INITIALIZE: (None, InitializeParams, types.InitializeResult),
+        TEXT_DOCUMENT_DIAGNOSTIC: (DiagnosticOptions, DocumentDiagnosticParams, DocumentDiagnosticReport),
+        WORKSPACE_DIAGNOSTIC: (None, WorkspaceDiagnosticParams, WorkspaceDiagnosticReport),
+    })
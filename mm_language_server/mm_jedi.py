@@ -1,20 +1,87 @@
 import ast
+import hashlib
+import os
+import re
+import threading
 from pathlib import Path
-from typing import List
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    TypeVar,
+)
 
 import parso
-from jedi import Script
+from jedi import Script, cache, debug
 from jedi.api import classes, helpers
 from jedi.api.helpers import validate_line_column
+from jedi.api.project import get_default_project
+from jedi.file_io import FileIO
+from jedi.inference import InferenceState, references
 from jedi.inference.gradual.conversion import convert_names, convert_values
+from jedi.inference.imports import load_module_from_path
+from parso.python import tree
 from parso.python.tree import Module, PythonNode
+from parso.utils import python_bytes_to_unicode
+
+from . import parso_utils
+from .cache_utils import LRUCache
+
+P = TypeVar("P", bound=Hashable)
+
+# Gets the files in which to search references of a name, most relevant
+# first, by the path of the project, the path of the script and the name.
+# None to let jedi search the project.
+ReferencePaths = Callable[[Path, Optional[Path], str], Optional[Iterable[str]]]
+
+# Like jedi, stop searching references after parsing so many other files,
+# so that common names don't make a search parse the whole workspace.
+_REFERENCE_FILE_LIMIT = references._PARSED_FILE_LIMIT  # pylint: disable=protected-access
 
 
 class MMScript(Script):
 
-    def __init__(self, code=None, *, path=None, environment=None, project=None, scope=None):
+    def __init__(
+        self,
+        code=None,
+        *,
+        path=None,
+        environment=None,
+        project=None,
+        scope=None,
+        module_node=None,
+        reference_paths: Optional[ReferencePaths] = None,
+    ):
         self.scope = scope
-        super().__init__(code, path=path, environment=environment, project=project)
+        self.reference_paths = reference_paths
+        if module_node is None:
+            super().__init__(code, path=path, environment=environment, project=project)
+            return
+
+        # Same as `Script.__init__`, but reuse the already parsed module
+        # instead of parsing the code again.
+        self._orig_path = path
+        if isinstance(path, str):
+            path = Path(path)
+
+        self.path = path.absolute() if path else None
+
+        if project is None:
+            project = get_default_project(None if self.path is None else self.path.parent)
+
+        self._inference_state = InferenceState(project, environment=environment, script_path=self.path)
+        self._module_node = module_node
+        code = module_node.get_code()
+        self._code_lines = parso.split_lines(code, keepends=True)
+        self._code = code
+
+        cache.clear_time_caches()
+        debug.reset_time()
 
     @validate_line_column
     def goto(
@@ -129,6 +196,111 @@ class MMScript(Script):
         # the API.
         return helpers.sorted_definitions(set(defs))
 
+    @validate_line_column
+    def get_references(self, line=None, column=None, *, include_builtins=True, scope="project"):
+        """Same as `Script.get_references`, but other modules are only
+        searched in the first files `reference_paths` returns for the name.
+
+        Jedi's own search is used without `reference_paths`, or if it
+        returns None.
+        """
+        tree_name = self._module_node.get_name_of_position((line, column))
+        paths = None
+        if scope == "project" and tree_name is not None and self.reference_paths is not None:
+            paths = self.reference_paths(self._inference_state.project.path, self.path, tree_name.value)
+        if paths is None:
+            return super().get_references(line, column, include_builtins=include_builtins, scope=scope)
+
+        names = find_references(self._get_module_context(), tree_name, paths)
+        definitions = [classes.Name(self._inference_state, n) for n in names]
+        if not include_builtins:
+            definitions = [d for d in definitions if not d.in_builtin_module()]
+        return helpers.sorted_definitions(definitions)
+
+
+def find_references(module_context, tree_name, paths: Iterable[str]):
+    """Same as `jedi.inference.references.find_references`, but other
+    modules are only searched in `paths` instead of the whole project.
+
+    Like jedi, at most `_REFERENCE_FILE_LIMIT` files are searched, the
+    first ones of `paths`.
+    """
+    # pylint: disable=protected-access
+    inf = module_context.inference_state
+    search_name = tree_name.value
+
+    # We disable flow analysis, because if we have ifs that are only true in
+    # certain cases, we want both sides.
+    try:
+        inf.flow_analysis_enabled = False
+        found_names = references._find_defining_names(module_context, tree_name)
+    finally:
+        inf.flow_analysis_enabled = True
+
+    found_names_dct = references._dictionarize(found_names)
+
+    module_contexts = [module_context]
+    for m in set(d.get_root_context() for d in found_names):
+        if m != module_context and m.tree_node is not None and inf.project.path in m.py__file__().parents:
+            module_contexts.append(m)
+    # For param no search for other modules is necessary.
+    potential_modules: Iterable[Any]
+    if any(n.api_type == "param" for n in found_names):
+        potential_modules = module_contexts
+    else:
+        potential_modules = _module_contexts_in_paths(inf, module_contexts, search_name, paths)
+
+    non_matching_reference_maps: Dict[Any, List[Dict[Any, Any]]] = {}
+    for module_context in potential_modules:
+        for name_leaf in module_context.tree_node.get_used_names().get(search_name, []):
+            new = references._dictionarize(references._find_names(module_context, name_leaf))
+            if any(tree_name in found_names_dct for tree_name in new):
+                found_names_dct.update(new)
+                for tree_name in new:
+                    for dct in non_matching_reference_maps.get(tree_name, []):
+                        # A reference that was previously searched for matches
+                        # with a now found name. Merge.
+                        found_names_dct.update(dct)
+                    non_matching_reference_maps.pop(tree_name, None)
+            else:
+                for name in new:
+                    non_matching_reference_maps.setdefault(name, []).append(new)
+    return found_names_dct.values()
+
+
+def _module_contexts_in_paths(inference_state, module_contexts, name, paths: Iterable[str]) -> Iterator:
+    """Same as `jedi.inference.references.get_module_contexts_containing_name`,
+    but with the files to search given, all of which use the name."""
+    for module_context in module_contexts:
+        if not module_context.is_compiled():
+            yield module_context
+    # Like jedi, don't search very short names in other modules.
+    if len(name) <= 2:
+        return
+    except_paths = {str(module_context.py__file__()) for module_context in module_contexts}
+    searched = 0
+    for path in paths:
+        if path in except_paths:
+            continue
+        if searched >= _REFERENCE_FILE_LIMIT:
+            debug.warning("Searched %s files for references, stopping", searched)
+            return
+        try:
+            module = load_module_from_path(inference_state, FileIO(path))
+        except OSError:
+            continue
+        searched += 1
+        if not module.is_compiled():
+            yield module.as_context()
+
+
+def find_base_name(module: Module) -> Optional[tree.Name]:
+    definitions = helpers.get_module_names(module, all_scopes=False)
+    for definition in definitions:
+        if definition.value == "_base_":
+            return definition
+    return None
+
 
 def find_base_files(module: Module, root_path: Path) -> list:
     definitions = helpers.get_module_names(module, all_scopes=False)
@@ -150,18 +322,160 @@ def find_base_files(module: Module, root_path: Path) -> list:
     return []
 
 
+def walk_bases(roots: Iterable[P], bases: Callable[[P], Iterable[P]]) -> List[P]:
+    """Get the unique configs reachable from `roots` in lookup order.
+
+    The order is the same as a depth-first search over `bases`, but every
+    config is only visited once, so shared ancestors (diamond inheritance)
+    are not walked again and cycles terminate. `bases` is called once for
+    every config returned, in that order.
+    """
+    visited = set()
+    order = []
+    stack = list(reversed(list(roots)))
+    while stack:
+        node = stack.pop()
+        if node in visited:
+            continue
+        visited.add(node)
+        order.append(node)
+        stack.extend(reversed(list(bases(node))))
+    return order
+
+
+def _normpath(path) -> Path:
+    return Path(os.path.normpath(os.path.abspath(path)))
+
+
+class BaseConfig:
+    """A parsed config file of the `_base_` inheritance graph.
+
+    Keeps the script of the file, its base files and a table of its
+    top-level definitions, so that looking up a name doesn't need to
+    parse the file again.
+    """
+
+    def __init__(self, path: Path, stat: os.stat_result, digest: str, code: bytes):
+        self.path = path
+        self.mtime = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.digest = digest
+        self._code = python_bytes_to_unicode(code, errors="replace")
+        self._parse()
+        self.bases = find_base_files(self.script._module_node, path.parent)
+        self.definitions: Dict[str, List[tree.Name]] = {}
+        for definition in helpers.get_module_names(self.script._module_node, all_scopes=False):
+            self.definitions.setdefault(definition.value, []).append(definition)
+
+    def _parse(self):
+        # Parse from scratch, so the module of the file opened in the
+        # editor is never updated with the content on disk.
+        self._grammar = parso_utils.get_grammar(None, self.path)
+        module, self._lines = parso_utils.parse_file(self._grammar, self.path, self._code)
+        self.script = MMScript(path=self.path, module_node=module)
+        self._defs: Dict[str, List[classes.Name]] = {}
+
+    def _ensure_registered(self):
+        """Make the module the one jedi sees for the path again, e.g. after
+        the file was opened in the editor."""
+        module = self.script._module_node
+        if parso_utils.is_changed(self._grammar, self.path, module, self._lines):
+            self._parse()
+        elif not parso_utils.is_registered(self._grammar, self.path, module, self._lines):
+            parso_utils.register(self._grammar, self.path, module, self._lines)
+
+    def goto(self, name: str) -> List[classes.Name]:
+        if name not in self.definitions:
+            return []
+        self._ensure_registered()
+        defs = self._defs.get(name)
+        if defs is None:
+            module_context = self.script._get_module_context()
+            names = module_context.goto(name, self.script._module_node.end_pos)
+            defs = [classes.Name(self.script._inference_state, d) for d in set(names)]
+            defs = list(set(helpers.sorted_definitions(defs)))
+            self._defs[name] = defs
+        return defs
+
+
+class BaseGraph:
+    """Workspace-level cache of the config files in `_base_` hierarchies.
+
+    A cached file is reused as long as its mtime and size are unchanged.
+    Otherwise its content hash is compared, and the file is only parsed
+    again if its content really changed. Only the most recently used
+    files are kept.
+    """
+
+    def __init__(self):
+        self._configs: LRUCache[Path, BaseConfig] = LRUCache("base_config", maxsize=256)
+        self._results = LRUCache("base_graph", maxsize=1024)
+        self._lock = threading.RLock()
+
+    def get(self, path: Path) -> Optional[BaseConfig]:
+        path = _normpath(path)
+        with self._lock:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                self._configs.evict(lambda key: key == path)
+                return None
+
+            config = self._configs.get(path)
+            if config is not None and (config.mtime, config.size) == (stat.st_mtime_ns, stat.st_size):
+                return config
+
+            try:
+                with open(path, "rb") as f:
+                    code = f.read()
+            except OSError:
+                self._configs.evict(lambda key: key == path)
+                return None
+            digest = hashlib.sha1(code).hexdigest()
+            if config is not None and config.digest == digest:
+                config.mtime, config.size = stat.st_mtime_ns, stat.st_size
+                return config
+
+            config = BaseConfig(path, stat, digest, code)
+            self._configs.put(path, config)
+            return config
+
+    def ancestors(self, base_files: List[Path]) -> List[BaseConfig]:
+        """Unique ancestors in lookup order, see `walk_bases`."""
+        configs: Dict[Path, Optional[BaseConfig]] = {}
+
+        def bases(path: Path) -> List[Path]:
+            config = configs[path] = self.get(path)
+            return [] if config is None else [_normpath(base) for base in config.bases]
+
+        paths = walk_bases([_normpath(base) for base in base_files], bases)
+        return [config for config in (configs[path] for path in paths) if config is not None]
+
+    def search(self, name: str, base_files: List[Path]) -> List[classes.Name]:
+        """Find the definitions of `name` in the first ancestor defining it.
+
+        Results are cached per graph, i.e. by the identities and content
+        hashes of all ancestors, so that any change in the hierarchy
+        invalidates them.
+        """
+        ancestors = self.ancestors(base_files)
+        key = (name, tuple((config.path, config.digest) for config in ancestors))
+        defs = self._results.get(key)
+        if defs is None:
+            defs = []
+            for config in ancestors:
+                defs = config.goto(name)
+                if defs:
+                    break
+            self._results.put(key, defs)
+        return defs
+
+
+BASE_GRAPH = BaseGraph()
+
+
 def search_def_in_bases(name, base_files):
-    for base in base_files:
-        script = MMScript(path=base)
-        defs = script._get_module_context().goto(name, script._module_node.end_pos)
-        if defs:
-            defs = [classes.Name(script._inference_state, d) for d in set(defs)]
-            return list(set(helpers.sorted_definitions(defs)))
-        nested_base_files = find_base_files(script._module_node, base.parent)
-        defs = search_def_in_bases(name, nested_base_files)
-        if defs:
-            return defs
-    return []
+    return BASE_GRAPH.search(name, base_files)
 
 
 def find_full_arg_name(leaf: PythonNode) -> str:
@@ -172,26 +486,91 @@ def find_full_arg_name(leaf: PythonNode) -> str:
         return parent.children[0].value
 
 
+_TYPE_STRING_PREFIX = re.compile(r"\btype\s*=\s*(?P<quote>['\"])(?P<prefix>[^'\"\\]*)$")
+
+_CLOSING_BRACKETS = {"(": ")", "[": "]", "{": "}"}
+
+
+def find_type_string_prefix(lines: List[str], line: int, column: int):
+    """Find the typed part of a ``type='...'`` string before the cursor.
+
+    `line` is 1-indexed and `column` is 0-indexed, like jedi. Returns the
+    full argument name of the ``type`` argument and the typed prefix, or
+    None if the cursor isn't in such a string. The string doesn't need
+    to be closed yet.
+    """
+    line_before_cursor = lines[line - 1][:column]
+    matched = _TYPE_STRING_PREFIX.search(line_before_cursor)
+    if matched is None:
+        return None
+
+    # Configs are mostly top-level statements, so parse from the start of the
+    # current top-level statement only, and close the string and brackets
+    # left open at the cursor.
+    start = line - 1
+    while start > 0 and not lines[start][:1].isidentifier():
+        start -= 1
+    snippet = "".join(lines[start:line - 1]) + line_before_cursor + matched.group("quote")
+    brackets = []
+    leaf = parso.parse(snippet).get_first_leaf()
+    while leaf is not None:
+        if leaf.type == "operator" and leaf.value in _CLOSING_BRACKETS:
+            brackets.append(_CLOSING_BRACKETS[leaf.value])
+        elif leaf.type == "operator" and brackets and leaf.value == brackets[-1]:
+            brackets.pop()
+        leaf = leaf.get_next_leaf()
+    snippet += "".join(reversed(brackets))
+
+    module = parso.parse(snippet)
+    leaf = module.get_leaf_for_position((line - start, column + 1), include_prefixes=True)
+    if leaf is None or leaf.type != "string":
+        return None
+    if leaf.parent.type != "argument" or leaf.parent.children[0].value != "type":
+        return None
+    return find_full_arg_name(leaf), matched.group("prefix")
+
+
+def complete_type_keys(lines: List[str], line: int, column: int, scope, case_insensitive: bool = False):
+    """Complete a registry key in a ``type='...'`` string.
+
+    Returns the typed prefix and the registry entries whose keys start
+    with it, or None if the cursor isn't in a registry-typed string.
+    """
+    from .registry_index import load_index
+    from .scopes import compile_pattern_list
+
+    dispatcher = compile_pattern_list(scope)
+    if dispatcher is None:
+        return None
+    found = find_type_string_prefix(lines, line, column)
+    if found is None:
+        return None
+    full_arg_name, prefix = found
+    item = dispatcher.match(full_arg_name)
+    if item is None:
+        return None
+    index = load_index(scope)
+    if index is None:
+        return None
+    return prefix, index.complete(item.registry_name, prefix, case_insensitive)
+
+
 def get_type_defs(leaf: PythonNode, script: MMScript):
     from jedi.inference.imports import goto_import
 
-    from .scopes import PatternItem, parse_pattern_list
+    from .registry_index import load_index
+    from .scopes import compile_pattern_list
 
-    pattern_list: List[PatternItem] = parse_pattern_list(script.scope)
-    if pattern_list is None:
+    dispatcher = compile_pattern_list(script.scope)
+    if dispatcher is None:
         return []
 
-    full_arg_name = find_full_arg_name(leaf)
-    registry = None
-    for item in pattern_list:
-        if item.pattern.match(full_arg_name):
-            if item.imports is not None:
-                item.imports()
-            registry = item.registry()
-
-    if registry is not None:
-        class_ = registry.get(leaf.value.strip("'\""))
-        pseudo_node = parso.parse(f"from {class_.__module__} import {class_.__name__}")
+    item = dispatcher.match(find_full_arg_name(leaf))
+    registry_name = item.registry_name if item is not None else None
+    index = load_index(script.scope) if registry_name is not None else None
+    entry = index.get(registry_name, leaf.value.strip("'\"")) if index is not None else None
+    if entry is not None:
+        pseudo_node = parso.parse(f"from {entry.module} import {entry.qualname.split('.')[0]}")
         classes_ = goto_import(
             script._get_module_context(),
             pseudo_node.children[0].get_last_leaf(),
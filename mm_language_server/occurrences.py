@@ -0,0 +1,204 @@
+"""Index of the occurrences of names in a document.
+
+Finds the occurrences of a name with the same binding as the name under
+the cursor from the parso tree only, which is much cheaper than jedi's
+reference search. The index is built lazily per name for every document
+version.
+
+Names whose binding can't be found from the syntax alone, like
+attributes, keyword arguments, names declared ``global`` or
+``nonlocal`` and comprehension variables, are left to jedi.
+"""
+
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from jedi import Project
+from jedi.parser_utils import get_parent_scope
+from parso.python.tree import Module, Name
+from parso.tree import BaseNode
+from pygls.lsp.types import NumType
+from pygls.workspace import Document
+
+from .cache_utils import LRUCache
+from .parso_utils import get_grammar, parse
+from .workspace_index import WorkspaceIndex
+
+_COMPREHENSION_TYPES = ("comp_for", "sync_comp_for")
+
+
+class Occurrence(NamedTuple):
+    """An occurrence of a name in a document."""
+
+    name: Name
+    is_definition: bool
+
+
+class _NameGroups(NamedTuple):
+    """The occurrences of a name grouped by the scope which binds them."""
+
+    groups: Dict[BaseNode, List[Occurrence]]
+    bound: Set[BaseNode]
+
+
+def _is_attribute(leaf: Name) -> bool:
+    previous = leaf.get_previous_leaf()
+    return previous is not None and previous.type == "operator" and previous.value == "."
+
+
+def _is_keyword_argument(leaf: Name) -> bool:
+    parent = leaf.parent
+    return (parent is not None and parent.type == "argument" and parent.children[0] is leaf and len(parent.children) > 1
+            and parent.children[1] == "=")
+
+
+def _is_import_path(leaf: Name) -> bool:
+    """True for the names of imported modules and objects which are not
+    bound by the import, like ``path`` in ``from os import path as p``."""
+    node = leaf.parent
+    while node is not None and node.type not in ("import_name", "import_from", "simple_stmt", "file_input"):
+        node = node.parent
+    return node is not None and node.type in ("import_name", "import_from") and not leaf.is_definition()
+
+
+class OccurrenceIndex:
+    """Occurrences of the names of a module, grouped by binding scope."""
+
+    def __init__(self, module: Module) -> None:
+        self.module = module
+        self._groups: Dict[str, Optional[_NameGroups]] = {}
+
+    def _group(self, name: str) -> Optional[_NameGroups]:
+        """Group the occurrences of a name by the scope which binds them.
+
+        Returns None if the binding of some occurrences can't be found
+        statically.
+        """
+        if name in self._groups:
+            return self._groups[name]
+
+        leaves = [
+            leaf for leaf in self.module.get_used_names().get(name, [])
+            if not _is_attribute(leaf) and not _is_keyword_argument(leaf) and not _is_import_path(leaf)
+        ]
+        bound = set()
+        for leaf in leaves:
+            if leaf.parent.type in ("global_stmt", "nonlocal_stmt"):
+                self._groups[name] = None
+                return None
+            if leaf.is_definition():
+                scope = get_parent_scope(leaf)
+                if scope.type in _COMPREHENSION_TYPES:
+                    self._groups[name] = None
+                    return None
+                bound.add(scope)
+
+        groups: Dict[BaseNode, List[Occurrence]] = {}
+        for leaf in leaves:
+            groups.setdefault(self._binding_scope(leaf, bound), []).append(Occurrence(leaf, leaf.is_definition()))
+        self._groups[name] = _NameGroups(groups, bound)
+        return self._groups[name]
+
+    def _binding_scope(self, leaf: Name, bound: Set[BaseNode]) -> BaseNode:
+        """Find the scope a name is bound in, the module for builtins."""
+        scope = get_parent_scope(leaf)
+        first = True
+        while scope is not None and scope.type != "file_input":
+            # Class bodies are not visible from the scopes nested in them.
+            if scope in bound and (first or scope.type != "classdef"):
+                return scope
+            first = False
+            scope = get_parent_scope(scope)
+        return self.module
+
+    def find(self, line: int, column: int) -> Optional[List[Occurrence]]:
+        """Get the occurrences of the name at a position.
+
+        Returns an empty list if there is no name at the position, and
+        None if the occurrences can only be found by jedi.
+        """
+        leaf = self.module.get_name_of_position((line, column))
+        if leaf is None:
+            return []
+        if _is_attribute(leaf) or _is_keyword_argument(leaf) or _is_import_path(leaf):
+            return None
+        name_groups = self._group(leaf.value)
+        if name_groups is None:
+            return None
+        return name_groups.groups.get(self._binding_scope(leaf, name_groups.bound), [])
+
+    def module_occurrences(self, name: str) -> Optional[List[Occurrence]]:
+        """Get the occurrences of a name bound at the module level.
+
+        Returns None if the occurrences can only be found by jedi.
+        """
+        name_groups = self._group(name)
+        if name_groups is None:
+            return None
+        return name_groups.groups.get(self.module, [])
+
+
+_INDEXES: LRUCache[Tuple[str, Optional[NumType]], OccurrenceIndex] = LRUCache("occurrences", maxsize=32)
+
+
+def _get_index(project: Optional[Project], document: Document) -> OccurrenceIndex:
+    key = (document.uri, document.version)
+    module = parse(project, document)
+    index = _INDEXES.get(key) if document.version is not None else None
+    if index is None or index.module is not module:
+        index = OccurrenceIndex(module)
+        if document.version is not None:
+            _INDEXES.evict(lambda k: k[0] == document.uri and k[1] != document.version)
+            _INDEXES.put(key, index)
+    return index
+
+
+def find_occurrences(project: Optional[Project], document: Document, line: int,
+                     column: int) -> Optional[List[Occurrence]]:
+    """Get the occurrences of the name at a position of a document.
+
+    Returns None if the occurrences can only be found by jedi.
+    """
+    return _get_index(project, document).find(line, column)
+
+
+def find_inherited_occurrences(
+    project: Optional[Project],
+    workspace_index: WorkspaceIndex,
+    get_document: Callable[[str], Document],
+    document: Document,
+    line: int,
+    column: int,
+) -> Dict[str, List[Occurrence]]:
+    """Get the occurrences of the module-level name at a position of a
+    config in the configs inheriting from it.
+
+    Configs inherit the names of their `_base_` configs without
+    importing them, so jedi doesn't find these references. Returns the
+    occurrences by document uri.
+    """
+    index = _get_index(project, document)
+    occurrences = index.find(line, column)
+    if not occurrences:
+        return {}
+    name = occurrences[0].name
+    # Only the names bound at the module level are inherited.
+    if name.value == "_base_" or index.module_occurrences(name.value) is not occurrences:
+        return {}
+
+    result = {}
+    for path in workspace_index.descendants(document.path) or []:
+        child = get_document(Path(path).as_uri())
+        try:
+            module = get_grammar(project, Path(path)).parse(child.source)
+        except (OSError, RecursionError):
+            continue
+        child_occurrences = OccurrenceIndex(module).module_occurrences(name.value)
+        if child_occurrences:
+            result[child.uri] = child_occurrences
+    return result
+
+
+def evict(uri: str) -> None:
+    """Forget the index of a document, e.g. when it is closed."""
+    _INDEXES.evict(lambda key: key[0] == uri)
@@ -0,0 +1,123 @@
+"""Utilities to work with parso.
+
+Keeps the parso module of every opened document so that edits are fed
+to parso's diff parser instead of reparsing the whole document.
+
+Jedi expects the module it works on to be the one in parso's parser
+cache for its path, and diff parses any other code of that path into
+it, e.g. the content on disk of a `_base_` config. So modules are
+registered there, and checked to still be registered before they are
+reused.
+"""
+
+from pathlib import Path
+from typing import Optional, Sequence, Tuple
+
+import parso.cache
+from jedi import Project
+from jedi.api.project import get_default_project
+from parso import Grammar, split_lines
+from parso.file_io import KnownContentFileIO
+from parso.python.tree import Module
+from pygls.lsp.types import NumType
+from pygls.uris import to_fs_path
+from pygls.workspace import Document
+
+from .cache_utils import LRUCache
+
+# The latest module of every opened document by uri, with its version and
+# lines, which the diff parser needs to update it.
+_TREES: LRUCache[str, Tuple[NumType, Sequence[str], Module]] = LRUCache("parso_tree", maxsize=64)
+
+
+def get_grammar(project: Optional[Project], path: Optional[Path] = None) -> Grammar:
+    """Get the grammar jedi uses for the scripts of a project."""
+    if project is None:
+        project = get_default_project(None if path is None else path.parent)
+    return project.get_environment().get_grammar()
+
+
+def _cache_item(grammar: Grammar, path: Path) -> Optional[parso.cache._NodeCacheItem]:
+    # pylint: disable=protected-access
+    return parso.cache.parser_cache.get(grammar._hashed, {}).get(path)
+
+
+def register(grammar: Grammar, path: Path, module: Module, lines: Sequence[str]) -> None:
+    """Make a module the one of its path in parso's parser cache, like
+    `Grammar.parse(diff_cache=True)` does."""
+    # pylint: disable=protected-access
+    file_io = KnownContentFileIO(path, "".join(lines))
+    parso.cache.try_to_save_module(grammar._hashed, file_io, module, lines, pickling=False)
+
+
+def is_registered(grammar: Grammar, path: Path, module: Module, lines: Sequence[str]) -> bool:
+    """Whether a module is still the one of its path in parso's parser cache."""
+    item = _cache_item(grammar, path)
+    return item is not None and item.node is module and item.lines is lines
+
+
+def is_changed(grammar: Grammar, path: Path, module: Module, lines: Sequence[str]) -> bool:
+    """Whether other code of the path was diff parsed into a module, which
+    then no longer has `lines`."""
+    item = _cache_item(grammar, path)
+    return item is not None and item.node is module and item.lines is not lines
+
+
+def parse_file(grammar: Grammar, path: Path, code: str) -> Tuple[Module, Sequence[str]]:
+    """Parse the code of a file from scratch and register its module.
+
+    Unlike `Grammar.parse(diff_cache=True)`, this never updates the module
+    of an opened document of the same path in place.
+    """
+    lines = split_lines(code, keepends=True)
+    module = grammar.parse(code, path=path, cache=False)
+    register(grammar, path, module, lines)
+    return module, lines
+
+
+def parse(project: Optional[Project], document: Document) -> Module:
+    """Get the parso module of a document.
+
+    The module of every version is parsed with parso's diff parser, which
+    only reparses the regions changed since the previous version. Note
+    that the diff parser updates the previous module in place. Documents
+    without a version are parsed from scratch every time.
+    """
+    path = Path(document.path).absolute()
+    grammar = get_grammar(project, path)
+    if document.version is None:
+        # Files which are not open are parsed once, e.g. for workspace
+        # diagnostics, so don't keep their modules.
+        return grammar.parse(document.source, path=path, cache=False)
+
+    latest = _TREES.get(document.uri)
+    if latest is not None and latest[0] == document.version and is_registered(grammar, path, latest[2], latest[1]):
+        return latest[2]
+
+    lines = split_lines(document.source, keepends=True)
+    if latest is None or is_changed(grammar, path, latest[2], latest[1]):
+        module = grammar.parse(document.source, path=path, cache=False)
+    elif latest[1] == lines:
+        module = latest[2]
+    else:
+        # Same as `Grammar.parse(diff_cache=True)`, but from our own module.
+        # pylint: disable=protected-access
+        module = grammar._diff_parser(grammar._pgen_grammar, grammar._tokenizer, latest[2]).update(
+            old_lines=latest[1],
+            new_lines=lines,
+        )
+    register(grammar, path, module, lines)
+    _TREES.put(document.uri, (document.version, lines, module))
+    return module
+
+
+def evict(project: Optional[Project], uri: str) -> None:
+    """Forget the parso module of a document, e.g. when it is closed."""
+    latest = _TREES.get(uri)
+    _TREES.evict(lambda key: key == uri)
+    path = Path(to_fs_path(uri)).absolute()
+    grammar = get_grammar(project, path)
+    item = _cache_item(grammar, path)
+    if latest is not None and item is not None and item.node is latest[2]:
+        # pylint: disable=protected-access
+        parso.cache.parser_cache[grammar._hashed].pop(path, None)
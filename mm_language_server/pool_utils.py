@@ -0,0 +1,57 @@
+"""Run CPU bound work, like parsing many files, in a process pool.
+
+A spawned worker starts a fresh interpreter which imports the language
+server, which takes about 0.4 seconds. So the pool is only used for work
+taking long enough in this process, and never with a single CPU, where it
+can't be faster. Callers estimate the time of their work from the size of
+its input and the rate at which it's processed.
+"""
+
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, List, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+log = logging.getLogger(__name__)
+
+# Use a pool only for work taking at least so many seconds in this process.
+# Two workers are faster than one process from about twice the time it
+# takes to start a worker.
+_POOL_THRESHOLD = 0.8
+_MAX_WORKERS = 8
+
+
+def max_workers() -> int:
+    """Get the number of workers of a pool."""
+    return min(os.cpu_count() or 1, _MAX_WORKERS)
+
+
+def use_pool(calls: int, seconds: float) -> bool:
+    """Whether to run `calls` taking `seconds` in total in a pool."""
+    return max_workers() >= 2 and calls >= 2 and seconds >= _POOL_THRESHOLD
+
+
+def map_in_pool(func: Callable[..., T], args: Sequence[Tuple[Any, ...]], seconds: float) -> List[T]:
+    """Call `func` with each tuple of `args` and return the results in order.
+
+    `seconds` is the estimated time of all calls in this process. If it's
+    worth it, see `use_pool`, the calls run in a process pool, so `func`,
+    its arguments and results must be picklable. If the pool breaks, e.g.
+    a worker is killed, the calls run in this process.
+    """
+    if not use_pool(len(args), seconds):
+        return [func(*arg) for arg in args]
+    workers = max_workers()
+    # Spawn instead of fork, the language server runs other threads.
+    context = multiprocessing.get_context("spawn")
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            chunksize = max(1, len(args) // (workers * 4))
+            return list(executor.map(func, *zip(*args), chunksize=chunksize))
+    except BrokenProcessPool as error:
+        log.warning("Process pool broke, running in this process: %s", error)
+        return [func(*arg) for arg in args]
@@ -0,0 +1,494 @@
+"""Index of the classes registered in the registries of OpenMMLab.
+
+Resolving a ``type='...'`` field needs the registries of a scope, which
+are only filled by importing the framework (and usually torch). The
+index is a snapshot of the registries, built once and cached on disk
+keyed by the versions of the installed packages, so later sessions only
+need to read a JSON file.
+
+The index is built in a short-lived subprocess, so the language server
+itself never imports the framework::
+
+    python -m mm_language_server.registry_index SCOPE OUTPUT
+
+Alternatively, the index can be built without importing anything by
+scanning the source files, see `use_static_scan`.
+"""
+
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import subprocess
+import sys
+import sysconfig
+import threading
+import time
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from .cache_utils import cache_home
+from .scopes import PatternItem, parse_pattern_list
+
+if TYPE_CHECKING:
+    from .registry_scanner import StaticScanner
+
+log = logging.getLogger(__name__)
+
+# Bump when the format of the cached index changes.
+_INDEX_FORMAT = 3
+
+# Seconds between two checks whether site-packages changed.
+_CHECK_INTERVAL = 10.0
+
+# Seconds before the build of an index is given up.
+_BUILD_TIMEOUT = 600.0
+
+_INDEXES: Dict[str, "RegistryIndex"] = {}
+_INDEX_PATHS: Dict[str, Path] = {}
+_BUILDS: Dict[str, threading.Thread] = {}
+# The cache paths whose build failed, which aren't built again.
+_FAILED: Dict[str, Path] = {}
+_STAMPS: Dict[str, Tuple[float, Tuple[Tuple[str, int], ...]]] = {}
+_SCANS: Dict[str, float] = {}
+_STATIC_SCANNER: Optional["StaticScanner"] = None
+_LOCK = threading.RLock()
+
+
+class RegistryEntry(NamedTuple):
+    """A class registered in a registry."""
+
+    registry: str
+    key: str
+    module: str
+    qualname: str
+    file: Optional[str]
+    line: Optional[int]
+    kind: str = "class"
+
+
+class _TrieNode:
+    __slots__ = ("children", "values")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.values: List[Any] = []
+
+
+class PrefixTrie:
+    """Values by string keys, which can be looked up by key prefix.
+
+    Finding the node of a prefix costs O(len(prefix)), independent of the
+    number of keys.
+    """
+
+    def __init__(self) -> None:
+        self._root = _TrieNode()
+
+    def insert(self, key: str, value: Any) -> None:
+        """Add a value under a key."""
+        node = self._root
+        for char in key:
+            node = node.children.setdefault(char, _TrieNode())
+        node.values.append(value)
+
+    def find(self, prefix: str) -> List[Any]:
+        """Get the values of all keys starting with `prefix`."""
+        node = self._root
+        for char in prefix:
+            child = node.children.get(char)
+            if child is None:
+                return []
+            node = child
+        values: List[Any] = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            values.extend(node.values)
+            stack.extend(node.children.values())
+        return values
+
+
+class RegistryIndex:
+    """Registered classes of a scope, by registry name and key.
+
+    Registry names are the full import names of the registries, like
+    ``mmcls.registry.MODELS``. `complete` are the registries whose keys,
+    including those of their parents, are all known.
+    """
+
+    def __init__(
+            self,
+            scope: str,
+            registries: Dict[str, Dict[str, RegistryEntry]],
+            complete: FrozenSet[str] = frozenset(),
+    ) -> None:
+        self.scope = scope
+        self.registries = registries
+        self.complete_registries = complete
+        self._tries: Dict[Tuple[str, bool], PrefixTrie] = {}
+
+    def get(self, registry: Optional[str], key: str) -> Optional[RegistryEntry]:
+        """Get the entry of a key in a registry."""
+        if registry is None:
+            return None
+        return self.registries.get(registry, {}).get(key)
+
+    def is_complete(self, registry: Optional[str]) -> bool:
+        """Whether a key missing from a registry is really not registered."""
+        return registry is not None and registry in self.complete_registries
+
+    def complete(self, registry: Optional[str], prefix: str, case_insensitive: bool = False) -> List[RegistryEntry]:
+        """Get the entries of a registry whose keys start with `prefix`.
+
+        The prefix trie of a registry is built on first use.
+        """
+        if registry is None or registry not in self.registries:
+            return []
+        trie = self._tries.get((registry, case_insensitive))
+        if trie is None:
+            trie = PrefixTrie()
+            for key, entry in self.registries[registry].items():
+                trie.insert(key.lower() if case_insensitive else key, entry)
+            self._tries[(registry, case_insensitive)] = trie
+        entries: List[RegistryEntry] = trie.find(prefix.lower() if case_insensitive else prefix)
+        return sorted(entries, key=lambda entry: entry.key)
+
+    def to_json(self) -> Dict[str, Any]:
+        """Convert to a JSON serializable dict."""
+        return {
+            "format": _INDEX_FORMAT,
+            "scope": self.scope,
+            "entries": [list(entry) for entries in self.registries.values() for entry in entries.values()],
+            "complete": sorted(self.complete_registries),
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "RegistryIndex":
+        """Create from the result of `to_json`."""
+        if data.get("format") != _INDEX_FORMAT:
+            raise ValueError(f"Unsupported registry index format {data.get('format')}")
+        registries: Dict[str, Dict[str, RegistryEntry]] = {}
+        for values in data["entries"]:
+            entry = RegistryEntry(*values)
+            registries.setdefault(entry.registry, {})[entry.key] = entry
+        return cls(data["scope"], registries, frozenset(data["complete"]))
+
+
+def _module_dict(registry: Any) -> Dict[str, Any]:
+    """Get the registered items of a registry of mmengine or mmcv."""
+    module_dict = getattr(registry, "module_dict", None)
+    if module_dict is None:
+        module_dict = getattr(registry, "_module_dict", {})
+    return module_dict
+
+
+def _registry_entry(registry_name: str, key: str, obj: Any) -> RegistryEntry:
+    try:
+        file: Optional[str] = inspect.getsourcefile(obj)
+        line: Optional[int] = inspect.getsourcelines(obj)[1]
+    except (TypeError, OSError):
+        file, line = None, None
+    return RegistryEntry(
+        registry=registry_name,
+        key=key,
+        module=obj.__module__,
+        qualname=getattr(obj, "__qualname__", obj.__name__),
+        file=file,
+        line=line,
+        kind="class" if inspect.isclass(obj) else "function",
+    )
+
+
+def build_index(scope: str) -> RegistryIndex:
+    """Build the index of a scope by importing its registries.
+
+    Keys registered in parent registries are included too, as
+    ``Registry.get`` falls back to them.
+
+    Raises `ImportError` if a registry or any of the modules filling it
+    can't be imported, as the index would miss their keys.
+    """
+    pattern_list: List[PatternItem] = parse_pattern_list(scope) or []
+    registries: Dict[str, Dict[str, RegistryEntry]] = {}
+    for item in pattern_list:
+        registry_name = item.registry_name
+        if registry_name is None or registry_name in registries:
+            continue
+        if item.imports is not None:
+            imported = item.imports()
+            modules = imported if isinstance(imported, list) else [imported]
+            failed = [name for name, module in zip(item.import_names, modules) if module is None]
+            if failed:
+                raise ImportError(f"Failed to import {', '.join(failed)}")
+        registry = item.registry()
+        if registry is None:
+            raise ImportError(f"Failed to import {registry_name}")
+        entries: Dict[str, RegistryEntry] = {}
+        while registry is not None:
+            for key, obj in _module_dict(registry).items():
+                if key not in entries:
+                    entries[key] = _registry_entry(registry_name, key, obj)
+            registry = getattr(registry, "parent", None)
+        registries[registry_name] = entries
+    # An empty registry most likely means that its modules weren't found.
+    complete = frozenset(name for name, entries in registries.items() if entries)
+    return RegistryIndex(scope, registries, complete)
+
+
+def _package_version(name: str) -> str:
+    # pylint: disable=import-outside-toplevel
+    try:
+        from importlib.metadata import version  # type: ignore
+    except ImportError:
+        from importlib_metadata import version  # type: ignore
+    try:
+        return str(version(name))
+    except ImportError:  # PackageNotFoundError
+        return "none"
+
+
+def _packages(scope: str) -> Set[str]:
+    """Get the top-level packages the registries of a scope come from."""
+    packages = {"mmengine"}
+    for item in parse_pattern_list(scope) or []:
+        names = item.import_names + ([item.registry_name] if item.registry_name else [])
+        packages.update(name.split(".")[0] for name in names)
+    return packages
+
+
+def index_key(scope: str) -> str:
+    """Get the key of the index of a scope.
+
+    The key changes whenever the version of any package the registries
+    are imported from changes. No package is imported to get the key.
+    """
+    versions = [f"{package}=={_package_version(package)}" for package in sorted(_packages(scope))]
+    content = "\n".join([str(_INDEX_FORMAT), sys.executable, scope, *versions])
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
+
+
+def cache_directory() -> Path:
+    """Get the directory where indexes are cached."""
+    return cache_home() / "registry"
+
+
+def cache_path(scope: str) -> Path:
+    """Get the path of the cached index of a scope."""
+    return cache_directory() / f"{scope}-{index_key(scope)}.json"
+
+
+def save_index(index: RegistryIndex, path: Path) -> None:
+    """Save an index to a JSON file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index.to_json(), f)
+    os.replace(tmp_path, path)
+
+
+def read_index(path: Path) -> Optional[RegistryIndex]:
+    """Read an index saved by `save_index`, None if it's unavailable."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return RegistryIndex.from_json(json.load(f))
+    except (OSError, ValueError, KeyError, TypeError) as error:
+        log.debug("Cannot read registry index %s: %s", path, error)
+        return None
+
+
+def build_index_in_subprocess(scope: str, path: Path) -> bool:
+    """Build the index of a scope in a subprocess and save it to `path`.
+
+    The subprocess imports the framework, dumps the registries and exits,
+    so none of the imported modules stay in the calling process.
+    """
+    command = [sys.executable, "-m", __name__, scope, str(path)]
+    try:
+        process = subprocess.run(
+            command,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            timeout=_BUILD_TIMEOUT,
+            check=False,
+        )
+    except (OSError, subprocess.TimeoutExpired) as error:
+        log.warning("Failed to build registry index of %s: %s", scope, error)
+        return False
+    if process.returncode != 0:
+        log.warning(
+            "Failed to build registry index of %s: %s",
+            scope,
+            process.stderr.decode("utf-8", errors="replace"),
+        )
+        return False
+    return True
+
+
+def _build_in_background(scope: str, build: Callable[[], Optional[RegistryIndex]]) -> None:
+    """Start building the index of a scope unless it's already building."""
+
+    def target() -> None:
+        try:
+            index = build()
+            if index is not None:
+                with _LOCK:
+                    _INDEXES[scope] = index
+        except Exception:  # pylint: disable=broad-except
+            log.exception("Failed to build registry index of %s", scope)
+        finally:
+            with _LOCK:
+                _BUILDS.pop(scope, None)
+
+    with _LOCK:
+        if scope in _BUILDS:
+            return
+        thread = threading.Thread(target=target, name=f"registry-index-{scope}", daemon=True)
+        _BUILDS[scope] = thread
+    thread.start()
+
+
+def _build_from_subprocess(scope: str, path: Path) -> Optional[RegistryIndex]:
+    if not build_index_in_subprocess(scope, path):
+        # Retrying is pointless until the installed packages change, which
+        # changes the cache path.
+        with _LOCK:
+            _FAILED[scope] = path
+        return None
+    index = read_index(path)
+    if index is not None:
+        with _LOCK:
+            _INDEX_PATHS[scope] = path
+    return index
+
+
+def use_static_scan(enable: bool) -> None:
+    """Build indexes by scanning source files instead of importing them.
+
+    See `registry_scanner.StaticScanner`.
+    """
+    global _STATIC_SCANNER  # pylint: disable=global-statement
+    # pylint: disable=import-outside-toplevel
+    from .registry_scanner import StaticScanner
+
+    with _LOCK:
+        _STATIC_SCANNER = StaticScanner() if enable else None
+        _INDEXES.clear()
+        _INDEX_PATHS.clear()
+        _FAILED.clear()
+        _SCANS.clear()
+
+
+def _load_static_index(scope: str, scanner: "StaticScanner") -> Optional[RegistryIndex]:
+    """Get the index of a scope built by the static scanner.
+
+    The source files are scanned again in the background at most every
+    `_CHECK_INTERVAL`, only files that changed are parsed again.
+    """
+    now = time.monotonic()
+    with _LOCK:
+        index = _INDEXES.get(scope)
+        last = _SCANS.get(scope)
+        due = last is None or now - last >= _CHECK_INTERVAL
+        if due:
+            _SCANS[scope] = now
+    if due:
+        _build_in_background(scope, functools.partial(scanner.scan, scope))
+    return index
+
+
+def _environment_stamp() -> Tuple[Tuple[str, int], ...]:
+    """Get the modification times of the site-packages directories.
+
+    Installing or removing a package changes the modification time of
+    the site-packages directory it lives in.
+    """
+    paths = sysconfig.get_paths()
+    directories = {paths["purelib"], paths["platlib"]}
+    if getattr(sys.flags, "no_user_site", 0) == 0:
+        directories.add(sysconfig.get_path("purelib", f"{os.name}_user"))
+    stamp = []
+    for directory in sorted(directories):
+        try:
+            stamp.append((directory, os.stat(directory).st_mtime_ns))
+        except OSError:
+            continue
+    return tuple(stamp)
+
+
+def _environment_changed(scope: str) -> bool:
+    """Check, at most every `_CHECK_INTERVAL`, if site-packages changed."""
+    now = time.monotonic()
+    with _LOCK:
+        last = _STAMPS.get(scope)
+        if last is not None and now - last[0] < _CHECK_INTERVAL:
+            return False
+        stamp = _environment_stamp()
+        _STAMPS[scope] = (now, stamp)
+        return last is not None and last[1] != stamp
+
+
+def load_index(scope: str, build: bool = True) -> Optional[RegistryIndex]:
+    """Get the index of a scope.
+
+    The index is read from the disk cache if available. Otherwise, if
+    `build` is true, it's built in the background and None is returned
+    until it's ready. When the installed packages change, a new index is
+    built in the background while the old one keeps being used. A build
+    which failed isn't retried until the installed packages change.
+    """
+    scanner = _STATIC_SCANNER
+    if scanner is not None:
+        return _load_static_index(scope, scanner)
+
+    with _LOCK:
+        index = _INDEXES.get(scope)
+        if index is not None and not _environment_changed(scope):
+            return index
+        path = cache_path(scope)
+        if index is not None and _INDEX_PATHS.get(scope) == path:
+            return index
+        new_index = read_index(path)
+        if new_index is not None:
+            _INDEXES[scope] = new_index
+            _INDEX_PATHS[scope] = path
+            _environment_changed(scope)
+            return new_index
+    if build and _FAILED.get(scope) != path:
+        _build_in_background(scope, functools.partial(_build_from_subprocess, scope, path))
+    return index
+
+
+def main(argv: List[str]) -> int:
+    """Build the index of a scope and save it, see `build_index_in_subprocess`."""
+    if len(argv) != 2:
+        print(f"usage: python -m {__name__} SCOPE OUTPUT", file=sys.stderr)
+        return 2
+    scope, output = argv
+    try:
+        index = build_index(scope)
+    except ImportError as error:
+        # Don't save an index missing the keys of the failed imports, it
+        # would be used until the installed packages change.
+        print(error, file=sys.stderr)
+        return 1
+    save_index(index, Path(output))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,3 +1,12 @@
-from .utils import PatternItem, from_import, import_modules, parse_pattern_list
+from .utils import (
+    PatternDispatcher,
+    PatternItem,
+    compile_pattern_list,
+    from_import,
+    import_modules,
+    parse_pattern_list,
+)
 
-__all__ = ['from_import', 'import_modules', 'parse_pattern_list', 'PatternItem']
+__all__ = [
+    'compile_pattern_list', 'from_import', 'import_modules', 'parse_pattern_list', 'PatternDispatcher', 'PatternItem'
+]
@@ -1,8 +1,9 @@
+import functools
 import re
 import warnings
 from dataclasses import dataclass
 from importlib import import_module
-from typing import Callable, Optional
+from typing import Callable, List, Optional
 
 MM_SCOPES = ['mmcls']
 
@@ -13,6 +14,26 @@ class PatternItem:
     registry: Callable
     imports: Optional[Callable] = None
 
+    @property
+    def registry_name(self) -> Optional[str]:
+        """The full name of the registry, like ``mmcls.registry.MODELS``.
+
+        Available without importing the registry if it's specified by
+        ``lazy_call(from_import)``.
+        """
+        if isinstance(self.registry, LazyCall) and self.registry.func is from_import:
+            from_, import_ = self.registry.args[:2]
+            return f'{from_}.{import_}'
+        return None
+
+    @property
+    def import_names(self) -> List[str]:
+        """The names of the modules to import to fill the registry."""
+        if isinstance(self.imports, LazyCall) and self.imports.func is import_modules:
+            imports = self.imports.args[0]
+            return [imports] if isinstance(imports, str) else list(imports)
+        return []
+
 
 def parse_pattern_list(scope):
     if scope in MM_SCOPES:
@@ -22,6 +43,39 @@ def parse_pattern_list(scope):
         return None
 
 
+class PatternDispatcher:
+    """Match an argument name against all patterns of a scope in one pass.
+
+    All patterns are combined into a single regex with one named group per
+    item. If several items match, the last item in the pattern list wins,
+    so more specific patterns should be put after general ones.
+    """
+
+    def __init__(self, pattern_list: List[PatternItem]):
+        self.items = list(pattern_list)
+        # Alternatives are tried from left to right, so reverse the items to
+        # let the last matching item win.
+        alternatives = [f'(?P<item{idx}>{item.pattern.pattern})' for idx, item in reversed(list(enumerate(self.items)))]
+        self.regex = re.compile('|'.join(alternatives)) if alternatives else None
+
+    def match(self, full_arg_name: str) -> Optional[PatternItem]:
+        if self.regex is None:
+            return None
+        matched = self.regex.match(full_arg_name)
+        if matched is None:
+            return None
+        name = next(name for name, value in matched.groupdict().items() if value is not None)
+        return self.items[int(name[len('item'):])]
+
+
+@functools.lru_cache(maxsize=None)
+def compile_pattern_list(scope) -> Optional[PatternDispatcher]:
+    pattern_list = parse_pattern_list(scope)
+    if pattern_list is None:
+        return None
+    return PatternDispatcher(pattern_list)
+
+
 def from_import(from_, import_, allow_failed_imports=True):
     if not isinstance(from_, str):
         raise TypeError(f'{from_} is of type {type(from_)} and cannot be imported.')
@@ -63,9 +117,25 @@ def import_modules(imports, allow_failed_imports=True):
     return imported
 
 
+class LazyCall:
+    """A function call delayed until the object is called.
+
+    The function and its arguments are kept, so that they can be
+    inspected without doing the call.
+    """
+
+    def __init__(self, func, *args, **kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+    def __call__(self):
+        return self.func(*self.args, **self.kwargs)
+
+
 def lazy_call(func):
 
     def wrapper(*args, **kwargs):
-        return lambda: func(*args, **kwargs)
+        return LazyCall(func, *args, **kwargs)
 
     return wrapper
@@ -6,8 +6,11 @@ Official language server spec:
     https://microsoft.github.io/language-server-protocol/specification
 """
 
+import asyncio
+import functools
 import itertools
-from typing import Any, List, Optional, Union
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar, Union
 
 from jedi import Project
 from jedi.api.refactoring import RefactoringError
@@ -29,6 +32,7 @@ from pygls.lsp.methods import (
     TEXT_DOCUMENT_DID_OPEN,
     TEXT_DOCUMENT_DID_SAVE,
     WORKSPACE_DID_CHANGE_CONFIGURATION,
+    WORKSPACE_DID_CHANGE_WATCHED_FILES,
     WORKSPACE_SYMBOL,
 )
 from pygls.lsp.types import (
@@ -40,36 +44,78 @@ from pygls.lsp.types import (
     CompletionList,
     CompletionOptions,
     CompletionParams,
+    Diagnostic,
     DidChangeConfigurationParams,
     DidChangeTextDocumentParams,
+    DidChangeWatchedFilesParams,
     DidCloseTextDocumentParams,
     DidOpenTextDocumentParams,
     DidSaveTextDocumentParams,
     DocumentHighlight,
+    DocumentHighlightKind,
     DocumentSymbol,
     DocumentSymbolParams,
+    FileChangeType,
     Hover,
-    InitializeParams,
     InitializeResult,
     Location,
     MarkupContent,
     MarkupKind,
     MessageType,
-    ParameterInformation,
+    NumType,
     RenameParams,
     SignatureHelp,
     SignatureHelpOptions,
-    SignatureInformation,
     SymbolInformation,
+    TextDocumentEdit,
     TextDocumentPositionParams,
     WorkspaceEdit,
     WorkspaceSymbolParams,
 )
 from pygls.protocol import LanguageServerProtocol, lsp_method
 from pygls.server import LanguageServer
-
-from . import jedi_utils, pygls_utils, text_edit_utils
+from pygls.uris import from_fs_path, to_fs_path
+from pygls.workspace import Document
+
+from . import (
+    cache_utils,
+    diagnostics,
+    jedi_utils,
+    lsp_types,
+    mm_jedi,
+    occurrences,
+    parso_utils,
+    pygls_utils,
+    registry_index,
+    text_edit_utils,
+)
 from .initialization_options import InitializationOptions
+from .lsp_types import (
+    TEXT_DOCUMENT_DIAGNOSTIC,
+    WORKSPACE_DIAGNOSTIC,
+    DiagnosticOptions,
+    DocumentDiagnosticParams,
+    DocumentDiagnosticReport,
+    FullDocumentDiagnosticReport,
+    InitializeParams,
+    ServerCapabilities,
+    UnchangedDocumentDiagnosticReport,
+    WorkspaceDiagnosticParams,
+    WorkspaceDiagnosticReport,
+    WorkspaceDocumentDiagnosticReport,
+    WorkspaceFullDocumentDiagnosticReport,
+    WorkspaceUnchangedDocumentDiagnosticReport,
+)
+from .worker import (
+    WORKER,
+    check_cancelled,
+    current_document,
+    current_documents,
+    snapshot,
+)
+from .workspace_index import WorkspaceIndex
+
+F = TypeVar("F", bound=Callable[..., Any])
 
 
 class JediLanguageServerProtocol(LanguageServerProtocol):
@@ -94,23 +140,50 @@ class JediLanguageServerProtocol(LanguageServerProtocol):
 
         initialization_options = server.initialization_options
         jedi_utils.set_jedi_settings(initialization_options)
+        # Read the cached registry index, or start building it in the
+        # background if there is none yet.
+        registry_index.use_static_scan(initialization_options.registry.static_scan)
+        registry_index.load_index(initialization_options.scope)
 
         # Configure didOpen, didChange, and didSave
         # currently need to be configured manually
-        diagnostics = initialization_options.diagnostics
-        did_open = (did_open_diagnostics if diagnostics.enable and diagnostics.did_open else did_open_default)
-        did_change = (did_change_diagnostics if diagnostics.enable and diagnostics.did_change else did_change_default)
-        did_save = (did_save_diagnostics if diagnostics.enable and diagnostics.did_save else did_save_default)
-        did_close = (did_close_diagnostics if diagnostics.enable else did_close_default)
+        diagnostics_options = initialization_options.diagnostics
+        did_open = (
+            did_open_diagnostics if diagnostics_options.enable and diagnostics_options.did_open else did_open_default)
+        did_change = (
+            did_change_diagnostics
+            if diagnostics_options.enable and diagnostics_options.did_change else did_change_default)
+        did_save = (
+            did_save_diagnostics if diagnostics_options.enable and diagnostics_options.did_save else did_save_default)
+        did_close = (did_close_diagnostics if diagnostics_options.enable else did_close_default)
         server.feature(TEXT_DOCUMENT_DID_OPEN)(did_open)
         server.feature(TEXT_DOCUMENT_DID_CHANGE)(did_change)
         server.feature(TEXT_DOCUMENT_DID_SAVE)(did_save)
         server.feature(TEXT_DOCUMENT_DID_CLOSE)(did_close)
 
+        # Clients supporting the pull model ask for the diagnostics they
+        # show, instead of getting them pushed for every edit.
+        text_document_capabilities = params.capabilities.text_document
+        server.pull_diagnostics = (
+            diagnostics_options.enable and text_document_capabilities is not None
+            and text_document_capabilities.diagnostic is not None)
+        server.diagnostics_changed = asyncio.Event()
+        if server.pull_diagnostics:
+            server.feature(TEXT_DOCUMENT_DIAGNOSTIC)(document_diagnostic)
+            server.feature(WORKSPACE_DIAGNOSTIC)(workspace_diagnostic)
+
         if server.initialization_options.hover.enable:
             server.feature(HOVER)(hover)
 
         initialize_result: InitializeResult = super().lsp_initialize(params)
+        if server.pull_diagnostics:
+            # pygls doesn't know the capability, so add it to the result.
+            capabilities = self.server_capabilities
+            self.server_capabilities = initialize_result.capabilities = ServerCapabilities(
+                **{name: getattr(capabilities, name)
+                   for name in capabilities.__fields_set__},
+                diagnostic_provider=DiagnosticOptions(inter_file_dependencies=True, workspace_diagnostics=True),
+            )
         server.project = (
             Project(
                 path=server.workspace.root_path,
@@ -118,6 +191,13 @@ class JediLanguageServerProtocol(LanguageServerProtocol):
                 smart_sys_path=True,
                 load_unsafe_extensions=False,
             ) if server.workspace.root_path else None)
+        if server.workspace.root_path:
+            server.workspace_index = WorkspaceIndex(
+                server.workspace.root_path,
+                initialization_options.workspace.symbols.ignore_folders,
+            )
+            server.workspace_index.start()
+        jedi_utils.use_workspace_index(server.workspace_index)
         return initialize_result
 
 
@@ -128,21 +208,76 @@ class JediLanguageServer(LanguageServer):
         protocol_cls.
     :attr project: a Jedi project. This value is created in
         `JediLanguageServerProtocol.lsp_initialize`.
+    :attr workspace_index: the symbol index of the workspace, built in the
+        background from `JediLanguageServerProtocol.lsp_initialize`.
+    :attr diagnostics_timers: the debounced diagnostics of documents which
+        are waiting for the typing to pause.
+    :attr pull_diagnostics: whether the client pulls diagnostics instead of
+        having them published.
+    :attr diagnostics_changed: set when the diagnostics of the workspace may
+        have changed, to answer pending workspace/diagnostic requests.
+    :attr workspace_diagnostics_reported: whether a workspace/diagnostic
+        request was answered, so that later requests wait for changes.
     """
 
     initialization_options: InitializationOptions
     project: Optional[Project]
+    workspace_index: Optional[WorkspaceIndex] = None
+    pull_diagnostics: bool = False
+    diagnostics_changed: asyncio.Event
+    workspace_diagnostics_reported: bool = False
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         super().__init__(*args, **kwargs)
+        self.diagnostics_timers: Dict[str, asyncio.TimerHandle] = {}
 
 
+lsp_types.install()
 SERVER = JediLanguageServer(protocol_cls=JediLanguageServerProtocol)
 
+
+def _run_on_worker(supersede: bool = True, all_documents: bool = False) -> Callable[[F], F]:
+    """Run a request handler on the jedi worker thread.
+
+    The event loop keeps handling messages while the handler runs, and
+    the handler stops at the next safe point when the client cancels the
+    request. With `supersede`, a new request for the same document
+    cancels the one still running, which is stale anyway. With
+    `all_documents`, all open documents are snapshotted for the handler,
+    not only the one of the request.
+    """
+
+    def decorator(handler: F) -> F:
+
+        @functools.wraps(handler)
+        async def wrapper(server: JediLanguageServer, params: Any) -> Any:
+            text_document = getattr(params, "text_document", None)
+            uri = text_document.uri if text_document is not None else None
+            documents = {}
+            if all_documents:
+                documents = {uri_: snapshot(document) for uri_, document in server.workspace.documents.items()}
+            if uri is not None:
+                # Snapshot on the event loop, which applies the edits.
+                documents[uri] = snapshot(server.workspace.get_document(uri))
+            key = (handler.__name__, uri) if supersede else None
+            return await WORKER.run(key, documents, handler, server, params)
+
+        return wrapper  # type: ignore
+
+    return decorator
+
+
+def _get_document(server: JediLanguageServer, uri: str) -> Document:
+    """Get the snapshot of a document taken for the running handler."""
+    document = current_document(uri)
+    return document if document is not None else server.workspace.get_document(uri)
+
+
 # Server capabilities
 
 
 @SERVER.feature(COMPLETION_ITEM_RESOLVE)
+@_run_on_worker(supersede=False)
 def completion_item_resolve(server: JediLanguageServer, params: CompletionItem) -> CompletionItem:
     """Resolves documentation and detail of given completion item."""
     markup_kind = _choose_markup(server)
@@ -153,6 +288,7 @@ def completion_item_resolve(server: JediLanguageServer, params: CompletionItem)
     COMPLETION,
     CompletionOptions(trigger_characters=[".", "'", '"'], resolve_provider=True),
 )
+@_run_on_worker()
 def completion(server: JediLanguageServer, params: CompletionParams) -> Optional[CompletionList]:
     """Returns completion items."""
     # pylint: disable=too-many-locals
@@ -160,17 +296,31 @@ def completion(server: JediLanguageServer, params: CompletionParams) -> Optional
     resolve_eagerly = server.initialization_options.completion.resolve_eagerly
     ignore_patterns = server.initialization_options.completion.ignore_patterns
     scope = server.initialization_options.scope
-    document = server.workspace.get_document(params.text_document.uri)
-    jedi_script = jedi_utils.script(server.project, document, scope)
+    document = _get_document(server, params.text_document.uri)
     jedi_lines = jedi_utils.line_column(params.position)
+    type_keys = mm_jedi.complete_type_keys(
+        document.lines,
+        *jedi_lines,
+        scope,
+        case_insensitive=server.initialization_options.jedi_settings.case_insensitive_completion,
+    )
+    if type_keys is not None and type_keys[1]:
+        prefix, entries = type_keys
+        return CompletionList(
+            is_incomplete=False,
+            items=[jedi_utils.lsp_registry_completion_item(entry, prefix, params.position) for entry in entries],
+        )
+    jedi_script = jedi_utils.script(server.project, document, scope)
     completions_jedi_raw = jedi_script.complete(*jedi_lines)
+    check_cancelled()
     if not ignore_patterns:
         # A performance optimization. ignore_patterns should usually be empty;
         # this special case avoid repeated filter checks for the usual case.
-        completions_jedi = (comp for comp in completions_jedi_raw)
+        completions_jedi = completions_jedi_raw
     else:
-        completions_jedi = (
-            comp for comp in completions_jedi_raw if not any(i.match(comp.name) for i in ignore_patterns))
+        completions_jedi = [
+            comp for comp in completions_jedi_raw if not any(i.match(comp.name) for i in ignore_patterns)
+        ]
     snippet_support = server.client_capabilities.get_capability(
         "text_document.completion.completion_item.snippet_support", False)
     markup_kind = _choose_markup(server)
@@ -181,10 +331,10 @@ def completion(server: JediLanguageServer, params: CompletionParams) -> Optional
     )
     enable_snippets = (snippet_support and not snippet_disable and not is_import_context)
     char_before_cursor = pygls_utils.char_before_cursor(
-        document=server.workspace.get_document(params.text_document.uri),
+        document=document,
         position=params.position,
     )
-    jedi_utils.clear_completions_cache()
+    completion_id = jedi_utils.cache_completions(completions_jedi)
     # number of characters in the string representation of the total number of
     # completions returned by jedi.
     total_completion_chars = len(str(len(completions_jedi_raw)))
@@ -193,15 +343,25 @@ def completion(server: JediLanguageServer, params: CompletionParams) -> Optional
             completion=completion,
             char_before_cursor=char_before_cursor,
             enable_snippets=enable_snippets,
-            resolve_eagerly=resolve_eagerly,
-            markup_kind=markup_kind,
             sort_append_text=str(count).zfill(total_completion_chars),
+            data={
+                "completionId": completion_id,
+                "index": count
+            },
         ) for count, completion in enumerate(completions_jedi)
     ]
+    if resolve_eagerly:
+        jedi_utils.lsp_completion_items_resolve(
+            completion_items,
+            markup_kind=markup_kind,
+            limit=server.initialization_options.completion.resolve_eagerly_limit,
+            budget=server.initialization_options.completion.resolve_eagerly_budget,
+        )
     return (CompletionList(is_incomplete=False, items=completion_items) if completion_items else None)
 
 
 @SERVER.feature(SIGNATURE_HELP, SignatureHelpOptions(trigger_characters=["(", ","]))
+@_run_on_worker()
 def signature_help(server: JediLanguageServer, params: TextDocumentPositionParams) -> Optional[SignatureHelp]:
     """Returns signature help.
 
@@ -209,36 +369,18 @@ def signature_help(server: JediLanguageServer, params: TextDocumentPositionParam
     handle markdown well in the signature. Will update if this changes in the
     future.
     """
-    document = server.workspace.get_document(params.text_document.uri)
+    document = _get_document(server, params.text_document.uri)
     scope = server.initialization_options.scope
-    jedi_script = jedi_utils.script(server.project, document, scope)
     jedi_lines = jedi_utils.line_column(params.position)
-    signatures_jedi = jedi_script.get_signatures(*jedi_lines)
     markup_kind = _choose_markup(server)
-    signatures = [
-        SignatureInformation(
-            label=jedi_utils.signature_string(signature),
-            documentation=MarkupContent(
-                kind=markup_kind,
-                value=jedi_utils.convert_docstring(
-                    signature.docstring(raw=True),
-                    markup_kind,
-                ),
-            ),
-            parameters=[ParameterInformation(label=info.to_string()) for info in signature.params],
-        ) for signature in signatures_jedi
-    ]
-    return (SignatureHelp(
-        signatures=signatures,
-        active_signature=0,
-        active_parameter=(signatures_jedi[0].index if signatures_jedi else 0),
-    ) if signatures else None)
+    return jedi_utils.lsp_signature_help(server.project, document, scope, *jedi_lines, markup_kind)
 
 
 @SERVER.feature(DEFINITION)
+@_run_on_worker()
 def definition(server: JediLanguageServer, params: TextDocumentPositionParams) -> Optional[List[Location]]:
     """Support Goto Definition."""
-    document = server.workspace.get_document(params.text_document.uri)
+    document = _get_document(server, params.text_document.uri)
     scope = server.initialization_options.scope
     jedi_script = jedi_utils.script(server.project, document, scope)
     jedi_lines = jedi_utils.line_column(params.position)
@@ -254,6 +396,7 @@ def definition(server: JediLanguageServer, params: TextDocumentPositionParams) -
 
 
 @SERVER.feature(DOCUMENT_HIGHLIGHT)
+@_run_on_worker()
 def highlight(server: JediLanguageServer, params: TextDocumentPositionParams) -> Optional[List[DocumentHighlight]]:
     """Support document highlight request.
 
@@ -266,20 +409,32 @@ def highlight(server: JediLanguageServer, params: TextDocumentPositionParams) ->
     Finally, we only return names if there are more than 1. Otherwise, we don't
     want to highlight anything.
     """
-    document = server.workspace.get_document(params.text_document.uri)
+    document = _get_document(server, params.text_document.uri)
     scope = server.initialization_options.scope
-    jedi_script = jedi_utils.script(server.project, document, scope)
     jedi_lines = jedi_utils.line_column(params.position)
+    occurrences_ = occurrences.find_occurrences(server.project, document, *jedi_lines)
+    if occurrences_ is not None:
+        highlight_names = [jedi_utils.lsp_document_highlight(*occurrence) for occurrence in occurrences_]
+        return highlight_names if highlight_names else None
+
+    # Only jedi knows the bindings of attributes, keyword arguments etc.
+    jedi_script = jedi_utils.script(server.project, document, scope)
     names = jedi_script.get_references(*jedi_lines, scope="file")
-    lsp_ranges = [jedi_utils.lsp_range(name) for name in names]
-    highlight_names = [DocumentHighlight(range=lsp_range) for lsp_range in lsp_ranges if lsp_range]
+    lsp_ranges = [(jedi_utils.lsp_range(name), name.is_definition()) for name in names]
+    highlight_names = [
+        DocumentHighlight(
+            range=lsp_range,
+            kind=DocumentHighlightKind.Write if is_definition else DocumentHighlightKind.Read,
+        ) for lsp_range, is_definition in lsp_ranges if lsp_range
+    ]
     return highlight_names if highlight_names else None
 
 
 # Registered with HOVER dynamically
+@_run_on_worker()
 def hover(server: JediLanguageServer, params: TextDocumentPositionParams) -> Optional[Hover]:
     """Support Hover."""
-    document = server.workspace.get_document(params.text_document.uri)
+    document = _get_document(server, params.text_document.uri)
     scope = server.initialization_options.scope
     jedi_script = jedi_utils.script(server.project, document, scope)
     jedi_lines = jedi_utils.line_column(params.position)
@@ -287,35 +442,59 @@ def hover(server: JediLanguageServer, params: TextDocumentPositionParams) -> Opt
     # jedi's help function is buggy when the column is 0. For this reason, as a
     # rote fix, we simply set the column to 1 if params.position returns column
     # 0.
-    hover_text = jedi_utils.hover_text(
-        jedi_script.help(
+    hover_text = jedi_utils.cached_hover_text(
+        jedi_utils.help_names(
+            jedi_script,
+            document,
             line=jedi_lines[0],
             column=1 if jedi_lines[1] == 0 else jedi_lines[1],
         ),
+        document,
         markup_kind,
         server.initialization_options,
     )
     if not hover_text:
         return None
     contents = MarkupContent(kind=markup_kind, value=hover_text)
-    document = server.workspace.get_document(params.text_document.uri)
     _range = pygls_utils.current_word_range(document, params.position)
     return Hover(contents=contents, range=_range)
 
 
 @SERVER.feature(REFERENCES)
+@_run_on_worker()
 def references(server: JediLanguageServer, params: TextDocumentPositionParams) -> Optional[List[Location]]:
     """Obtain all references to text."""
-    document = server.workspace.get_document(params.text_document.uri)
+    document = _get_document(server, params.text_document.uri)
     scope = server.initialization_options.scope
     jedi_script = jedi_utils.script(server.project, document, scope)
     jedi_lines = jedi_utils.line_column(params.position)
     names = jedi_script.get_references(*jedi_lines)
     locations = [location for location in (jedi_utils.lsp_location(name) for name in names) if location is not None]
+    check_cancelled()
+    for uri, occurrences_ in _inherited_occurrences(server, document, jedi_lines).items():
+        locations.extend(
+            Location(uri=uri, range=jedi_utils.lsp_document_highlight(*occurrence).range)
+            for occurrence in occurrences_)
     return locations if locations else None
 
 
+def _inherited_occurrences(server: JediLanguageServer, document: Document,
+                           jedi_lines: Tuple[int, int]) -> Dict[str, List[occurrences.Occurrence]]:
+    """Find the occurrences of a config name in the configs inheriting it,
+    which jedi doesn't know about."""
+    if server.workspace_index is None:
+        return {}
+    return occurrences.find_inherited_occurrences(
+        server.project,
+        server.workspace_index,
+        functools.partial(_get_document, server),
+        document,
+        *jedi_lines,
+    )
+
+
 @SERVER.feature(DOCUMENT_SYMBOL)
+@_run_on_worker()
 def document_symbol(server: JediLanguageServer,
                     params: DocumentSymbolParams) -> Optional[Union[List[DocumentSymbol], List[SymbolInformation]]]:
     """Document Python document symbols, hierarchically if possible.
@@ -336,22 +515,15 @@ def document_symbol(server: JediLanguageServer,
     non-hierarchical symbols, we simply remove `param` symbols. Others are
     included for completeness.
     """
-    document = server.workspace.get_document(params.text_document.uri)
+    document = _get_document(server, params.text_document.uri)
     scope = server.initialization_options.scope
     jedi_script = jedi_utils.script(server.project, document, scope)
-    names = jedi_script.get_names(all_scopes=True, definitions=True)
-    if server.client_capabilities.get_capability(
-            "text_document.document_symbol.hierarchical_document_symbol_support",
-            False,
-    ):
-        document_symbols = jedi_utils.lsp_document_symbols(names)
-        return document_symbols if document_symbols else None
-
-    symbol_information = [
-        symbol_info for symbol_info in (jedi_utils.lsp_symbol_information(name) for name in names
-                                        if name.type != "param") if symbol_info is not None
-    ]
-    return symbol_information if symbol_information else None
+    hierarchical = server.client_capabilities.get_capability(
+        "text_document.document_symbol.hierarchical_document_symbol_support",
+        False,
+    )
+    symbols = jedi_utils.cached_document_symbols(jedi_script, document, hierarchical)
+    return symbols if symbols else None  # type: ignore
 
 
 def _ignore_folder(path_check: str, jedi_ignore_folders: List[str]) -> bool:
@@ -366,6 +538,7 @@ def _ignore_folder(path_check: str, jedi_ignore_folders: List[str]) -> bool:
 
 
 @SERVER.feature(WORKSPACE_SYMBOL)
+@_run_on_worker()
 def workspace_symbol(server: JediLanguageServer, params: WorkspaceSymbolParams) -> Optional[List[SymbolInformation]]:
     """Document Python workspace symbols.
 
@@ -378,6 +551,14 @@ def workspace_symbol(server: JediLanguageServer, params: WorkspaceSymbolParams)
     """
     if not server.project:
         return None
+    max_symbols = server.initialization_options.workspace.symbols.max_symbols
+    if server.workspace_index is not None:
+        workspace_symbols = server.workspace_index.search(params.query, max_symbols)
+        if workspace_symbols is not None:
+            symbols = [jedi_utils.lsp_workspace_symbol(symbol) for symbol in workspace_symbols]
+            return symbols if symbols else None
+
+    # Search with jedi while the index is being built.
     names = server.project.complete_search(params.query)
     workspace_root = server.workspace.root_path
     ignore_folders = (server.initialization_options.workspace.symbols.ignore_folders)
@@ -387,15 +568,16 @@ def workspace_symbol(server: JediLanguageServer, params: WorkspaceSymbolParams)
     _symbols = (
         symbol for symbol in (jedi_utils.lsp_symbol_information(name) for name in unignored_names)
         if symbol is not None)
-    max_symbols = server.initialization_options.workspace.symbols.max_symbols
     symbols = (list(itertools.islice(_symbols, max_symbols)) if max_symbols > 0 else list(_symbols))
     return symbols if symbols else None
 
 
 @SERVER.feature(RENAME)
+@_run_on_worker(all_documents=True)
 def rename(server: JediLanguageServer, params: RenameParams) -> Optional[WorkspaceEdit]:
     """Rename a symbol across a workspace."""
-    document = server.workspace.get_document(params.text_document.uri)
+    get_document = functools.partial(_get_document, server)
+    document = get_document(params.text_document.uri)
     scope = server.initialization_options.scope
     jedi_script = jedi_utils.script(server.project, document, scope)
     jedi_lines = jedi_utils.line_column(params.position)
@@ -403,7 +585,18 @@ def rename(server: JediLanguageServer, params: RenameParams) -> Optional[Workspa
         refactoring = jedi_script.rename(*jedi_lines, new_name=params.new_name)
     except RefactoringError:
         return None
-    changes = text_edit_utils.lsp_document_changes(server.workspace, refactoring)
+    changes = text_edit_utils.lsp_document_changes(get_document, refactoring)
+    edits = [change for change in changes if isinstance(change, TextDocumentEdit)]
+    changed_uris = {edit.text_document.uri for edit in edits}
+    # File renames must come after the edits.
+    changes[len(edits):len(edits)] = [
+        text_edit_utils.lsp_rename_edit(
+            get_document(uri),
+            [occurrence.name for occurrence in occurrences_],
+            params.new_name,
+        ) for uri, occurrences_ in _inherited_occurrences(server, document, jedi_lines).items()
+        if uri not in changed_uris
+    ]
     return WorkspaceEdit(document_changes=changes) if changes else None
 
 
@@ -414,6 +607,7 @@ def rename(server: JediLanguageServer, params: RenameParams) -> Optional[Workspa
         CodeActionKind.RefactorExtract,
     ], ),
 )
+@_run_on_worker()
 def code_action(server: JediLanguageServer, params: CodeActionParams) -> Optional[List[CodeAction]]:
     """Get code actions.
 
@@ -422,7 +616,8 @@ def code_action(server: JediLanguageServer, params: CodeActionParams) -> Optiona
         2. Extract variable
         3. Extract function
     """
-    document = server.workspace.get_document(params.text_document.uri)
+    get_document = functools.partial(_get_document, server)
+    document = get_document(params.text_document.uri)
     scope = server.initialization_options.scope
     jedi_script = jedi_utils.script(server.project, document, scope)
     code_actions = []
@@ -437,7 +632,7 @@ def code_action(server: JediLanguageServer, params: CodeActionParams) -> Optiona
     except (RefactoringError, AttributeError, IndexError):
         inline_changes = []
     else:
-        inline_changes = text_edit_utils.lsp_document_changes(server.workspace, inline_refactoring)
+        inline_changes = text_edit_utils.lsp_document_changes(get_document, inline_refactoring)
     if inline_changes:
         code_actions.append(
             CodeAction(
@@ -452,7 +647,7 @@ def code_action(server: JediLanguageServer, params: CodeActionParams) -> Optiona
     except (RefactoringError, AttributeError, IndexError):
         extract_variable_changes = []
     else:
-        extract_variable_changes = text_edit_utils.lsp_document_changes(server.workspace, extract_variable_refactoring)
+        extract_variable_changes = text_edit_utils.lsp_document_changes(get_document, extract_variable_refactoring)
     if extract_variable_changes:
         code_actions.append(
             CodeAction(
@@ -467,7 +662,7 @@ def code_action(server: JediLanguageServer, params: CodeActionParams) -> Optiona
     except (RefactoringError, AttributeError, IndexError):
         extract_function_changes = []
     else:
-        extract_function_changes = text_edit_utils.lsp_document_changes(server.workspace, extract_function_refactoring)
+        extract_function_changes = text_edit_utils.lsp_document_changes(get_document, extract_function_refactoring)
     if extract_function_changes:
         code_actions.append(
             CodeAction(
@@ -491,43 +686,241 @@ def did_change_configuration(
     """
 
 
+@SERVER.command("mm-language-server.cacheStats")
+def cache_stats(
+        server: JediLanguageServer,  # pylint: disable=unused-argument
+        params: Any,  # pylint: disable=unused-argument
+) -> Dict[str, Dict[str, Any]]:
+    """Return the size and hit/miss counters of all caches."""
+    return cache_utils.cache_stats()
+
+
 # Static capability or initializeOptions functions that rely on a specific
 # client capability or user configuration. These are associated with
 # JediLanguageServer within JediLanguageServerProtocol.lsp_initialize
 def _publish_diagnostics(server: JediLanguageServer, uri: str) -> None:
-    """Helper function to publish diagnostics for a file."""
-    document = server.workspace.get_document(uri)
-    scope = server.initialization_options.scope
-    jedi_script = jedi_utils.script(server.project, document, scope)
-    errors = jedi_script.get_syntax_errors()
-    diagnostics = [jedi_utils.lsp_diagnostic(error) for error in errors]
-    server.publish_diagnostics(uri, diagnostics)
+    """Helper function to publish diagnostics for a file.
+
+    Clients pulling diagnostics are only told that they changed.
+    """
+    _cancel_diagnostics(server, uri)
+    if server.pull_diagnostics:
+        _diagnostics_changed(server)
+        return
+    WORKER.submit(
+        _check_document,
+        server,
+        snapshot(server.workspace.get_document(uri)),
+        diagnostics.open_sources(server.workspace.documents.values()),
+    )
+
+
+def _schedule_diagnostics(server: JediLanguageServer, uri: str) -> None:
+    """Publish diagnostics for a file once the edits pause."""
+    debounce = server.initialization_options.diagnostics.debounce
+    if debounce <= 0:
+        _publish_diagnostics(server, uri)
+        return
+    _cancel_diagnostics(server, uri)
+    server.diagnostics_timers[uri] = server.loop.call_later(debounce, _publish_diagnostics, server, uri)
+
+
+def _cancel_diagnostics(server: JediLanguageServer, uri: str) -> None:
+    timer = server.diagnostics_timers.pop(uri, None)
+    if timer is not None:
+        timer.cancel()
+
+
+def _diagnostics_changed(server: JediLanguageServer) -> None:
+    """Answer the pending workspace/diagnostic requests."""
+    server.diagnostics_changed.set()
+    server.diagnostics_changed = asyncio.Event()
+
+
+def _check_document(server: JediLanguageServer, document: Document, sources: Dict[str, str]) -> None:
+    """Compute the diagnostics of a document on the worker thread."""
+    if not _is_current(server, document.uri, document.version):
+        return
+    result = diagnostics.diagnose(server.project, document, server.initialization_options.scope, sources)
+    if result is not None:
+        _send_diagnostics(server, document.uri, result.diagnostics, document.version)
+
+
+def _send_diagnostics(
+    server: JediLanguageServer,
+    uri: str,
+    items: List[Diagnostic],
+    version: Optional[NumType] = None,
+) -> None:
+    """Publish diagnostics from the worker thread through the event loop.
+
+    Diagnostics computed for a `version` which is outdated by then are
+    dropped.
+    """
+
+    def publish() -> None:
+        if version is None or _is_current(server, uri, version):
+            server.publish_diagnostics(uri, items)
+
+    server.loop.call_soon_threadsafe(publish)
+
+
+def _is_current(server: JediLanguageServer, uri: str, version: Optional[NumType]) -> bool:
+    """Whether a version is the latest of an open document."""
+    document = server.workspace.documents.get(uri)
+    return document is not None and document.version == version
+
+
+# Registered with TEXT_DOCUMENT_DIAGNOSTIC dynamically
+@_run_on_worker(all_documents=True)
+def document_diagnostic(server: JediLanguageServer, params: DocumentDiagnosticParams) -> DocumentDiagnosticReport:
+    """Support pulling the diagnostics of a document."""
+    document = _get_document(server, params.text_document.uri)
+    result = diagnostics.diagnose(
+        server.project,
+        document,
+        server.initialization_options.scope,
+        diagnostics.open_sources(current_documents().values()),
+    )
+    if result is None:
+        return FullDocumentDiagnosticReport(kind="full", items=[])
+    if result.result_id == params.previous_result_id:
+        return UnchangedDocumentDiagnosticReport(kind="unchanged", result_id=result.result_id)
+    return FullDocumentDiagnosticReport(kind="full", result_id=result.result_id, items=result.diagnostics)
+
+
+# Seconds after which pending workspace/diagnostic requests check again.
+_WORKSPACE_DIAGNOSTICS_POLL = 30.0
+
+
+# Registered with WORKSPACE_DIAGNOSTIC dynamically
+async def workspace_diagnostic(server: JediLanguageServer,
+                               params: WorkspaceDiagnosticParams) -> WorkspaceDiagnosticReport:
+    """Support pulling the diagnostics of all configs of the workspace.
+
+    The first request is answered right away, with no reports while the
+    workspace index is being built. Clients ask again as soon as they get
+    the report, so later requests are kept open until some diagnostics
+    changed, like the specification suggests. Files changed by other
+    programs are noticed by checking again every
+    `_WORKSPACE_DIAGNOSTICS_POLL` seconds.
+    """
+    previous = {result_id.uri: result_id.value for result_id in params.previous_result_ids}
+    while True:
+        changed = server.diagnostics_changed
+        documents = {uri: snapshot(document) for uri, document in server.workspace.documents.items()}
+        reports = await WORKER.run(("workspace_diagnostic", None), documents, _workspace_reports, server, previous)
+        if not server.workspace_diagnostics_reported or (reports is not None and any(
+                isinstance(report, WorkspaceFullDocumentDiagnosticReport) for report in reports)):
+            server.workspace_diagnostics_reported = True
+            return WorkspaceDiagnosticReport(items=reports or [])
+        try:
+            # Not much to wait for while the workspace index is being built.
+            await asyncio.wait_for(changed.wait(), _WORKSPACE_DIAGNOSTICS_POLL if reports is not None else 1.0)
+        except asyncio.TimeoutError:
+            pass
+
+
+def _workspace_reports(server: JediLanguageServer,
+                       previous: Dict[str, str]) -> Optional[List[WorkspaceDocumentDiagnosticReport]]:
+    """Get the diagnostic reports of all configs of the workspace.
+
+    Returns None while the workspace index is being built.
+    """
+    paths = server.workspace_index.config_files() if server.workspace_index is not None else []
+    if paths is None:
+        return None
+    previous = dict(previous)
+    documents = {
+        os.path.normpath(os.path.abspath(document.path)): document
+        for document in current_documents().values()
+    }
+    reports: List[WorkspaceDocumentDiagnosticReport] = []
+    results = diagnostics.diagnose_many(paths, server.initialization_options.scope,
+                                        diagnostics.open_sources(documents.values()))
+    for path, result in results.items():
+        document = documents.get(path)
+        uri = document.uri if document is not None else from_fs_path(path)
+        version = document.version if document is not None else None
+        if previous.pop(uri, None) == result.result_id:
+            reports.append(
+                WorkspaceUnchangedDocumentDiagnosticReport(
+                    kind="unchanged",
+                    result_id=result.result_id,
+                    uri=uri,
+                    version=version,
+                ))
+        else:
+            reports.append(
+                WorkspaceFullDocumentDiagnosticReport(
+                    kind="full",
+                    result_id=result.result_id,
+                    items=result.diagnostics,
+                    uri=uri,
+                    version=version,
+                ))
+    # Clear the diagnostics of configs which were deleted.
+    reports.extend(WorkspaceFullDocumentDiagnosticReport(kind="full", items=[], uri=uri) for uri in previous)
+    return reports
 
 
 # TEXT_DOCUMENT_DID_SAVE
 def did_save_diagnostics(server: JediLanguageServer, params: DidSaveTextDocumentParams) -> None:
     """Actions run on textDocument/didSave: diagnostics."""
+    _files_changed(server, [server.workspace.get_document(params.text_document.uri).path])
     _publish_diagnostics(server, params.text_document.uri)
 
 
-def did_save_default(
-        server: JediLanguageServer,  # pylint: disable=unused-argument
-        params: DidSaveTextDocumentParams,  # pylint: disable=unused-argument
-) -> None:
+def did_save_default(server: JediLanguageServer, params: DidSaveTextDocumentParams) -> None:
     """Actions run on textDocument/didSave: default."""
+    _files_changed(server, [server.workspace.get_document(params.text_document.uri).path])
+
+
+@SERVER.feature(WORKSPACE_DID_CHANGE_WATCHED_FILES)
+def did_change_watched_files(server: JediLanguageServer, params: DidChangeWatchedFilesParams) -> None:
+    """Actions run on workspace/didChangeWatchedFiles."""
+    _files_changed(
+        server,
+        [to_fs_path(change.uri) for change in params.changes],
+        created=any(change.type == FileChangeType.Created for change in params.changes),
+    )
+
+
+def _files_changed(server: JediLanguageServer, paths: List[str], created: bool = False) -> None:
+    """Rescan the symbols of files changed on disk, and forget the scripts
+    which read their old content."""
+    if server.workspace_index is not None:
+        for path in paths:
+            WORKER.submit(server.workspace_index.update, path)
+    WORKER.submit(jedi_utils.evict_scripts, paths, created)
 
 
 # TEXT_DOCUMENT_DID_CHANGE
 def did_change_diagnostics(server: JediLanguageServer, params: DidChangeTextDocumentParams) -> None:
     """Actions run on textDocument/didChange: diagnostics."""
-    _publish_diagnostics(server, params.text_document.uri)
+    _update_tree(server, params.text_document.uri)
+    _schedule_diagnostics(server, params.text_document.uri)
 
 
-def did_change_default(
-        server: JediLanguageServer,  # pylint: disable=unused-argument
-        params: DidChangeTextDocumentParams,  # pylint: disable=unused-argument
-) -> None:
+def did_change_default(server: JediLanguageServer, params: DidChangeTextDocumentParams) -> None:
     """Actions run on textDocument/didChange: default."""
+    _update_tree(server, params.text_document.uri)
+
+
+def _update_tree(server: JediLanguageServer, uri: str) -> None:
+    """Feed the latest edit of a document to parso's diff parser."""
+    WORKER.submit(parso_utils.parse, server.project, snapshot(server.workspace.get_document(uri)))
+
+
+def _evict_document(server: JediLanguageServer, uri: str) -> None:
+    """Forget everything cached for a document, e.g. when it is closed."""
+    WORKER.submit(_evict_caches, server, uri)
+
+
+def _evict_caches(server: JediLanguageServer, uri: str) -> None:
+    jedi_utils.evict_script(uri)
+    occurrences.evict(uri)
+    parso_utils.evict(server.project, uri)
 
 
 # TEXT_DOCUMENT_DID_OPEN
@@ -546,14 +939,18 @@ def did_open_default(
 # TEXT_DOCUMENT_DID_CLOSE
 def did_close_diagnostics(server: JediLanguageServer, params: DidCloseTextDocumentParams) -> None:
     """Actions run on textDocument/didClose: diagnostics."""
-    server.publish_diagnostics(params.text_document.uri, [])
+    _cancel_diagnostics(server, params.text_document.uri)
+    _evict_document(server, params.text_document.uri)
+    if server.pull_diagnostics:
+        _diagnostics_changed(server)
+    else:
+        # After the diagnostics of jobs still waiting on the worker.
+        WORKER.submit(_send_diagnostics, server, params.text_document.uri, [])
 
 
-def did_close_default(
-        server: JediLanguageServer,  # pylint: disable=unused-argument
-        params: DidCloseTextDocumentParams,  # pylint: disable=unused-argument
-) -> None:
+def did_close_default(server: JediLanguageServer, params: DidCloseTextDocumentParams) -> None:
     """Actions run on textDocument/didClose: default."""
+    _evict_document(server, params.text_document.uri)
 
 
 def _choose_markup(server: JediLanguageServer) -> MarkupKind:
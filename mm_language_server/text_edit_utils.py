@@ -6,10 +6,13 @@ This module is a bridge between `jedi.Refactoring` and
 
 import ast
 import difflib
+import logging
+import os
 from bisect import bisect_right
-from typing import Iterator, List, NamedTuple, Union
+from typing import Callable, Iterator, List, NamedTuple, Tuple, Union
 
-from jedi.api.refactoring import ChangedFile, Refactoring
+from jedi.api.refactoring import Refactoring
+from parso.python.tree import Name
 from pygls.lsp.types import (
     Position,
     Range,
@@ -20,7 +23,21 @@ from pygls.lsp.types import (
     TextEdit,
     VersionedTextDocumentIdentifier,
 )
-from pygls.workspace import Document, Workspace
+from pygls.workspace import Document
+
+from .pool_utils import map_in_pool
+
+log = logging.getLogger(__name__)
+
+# Characters of old and new code converted to text edits per second,
+# measured on renames in files of 200 to 20 000 lines.
+_CONVERT_RATE = 650_000
+
+# (start line, start character, end line, end character, new text)
+EditTuple = Tuple[int, int, int, int, str]
+
+# Gets the document of a uri, as it was when the refactoring was computed.
+DocumentGetter = Callable[[str], Document]
 
 
 def is_valid_python(code: str) -> bool:
@@ -33,14 +50,17 @@ def is_valid_python(code: str) -> bool:
 
 
 def lsp_document_changes(
-    workspace: Workspace,
+    get_document: DocumentGetter,
     refactoring: Refactoring,
 ) -> List[Union[TextDocumentEdit, RenameFile]]:
     """Get lsp text document edits from Jedi refactoring.
 
-    This is the main public function that you probably want
+    This is the main public function that you probably want. The edits
+    are computed against, and versioned with, the documents returned by
+    `get_document`, which must be the ones the refactoring was computed
+    from, not newer versions.
     """
-    converter = RefactoringConverter(workspace, refactoring)
+    converter = RefactoringConverter(get_document, refactoring)
     return [
         *converter.lsp_text_document_edits(),
         *converter.lsp_renames(),
@@ -50,8 +70,8 @@ def lsp_document_changes(
 class RefactoringConverter:
     """Convert jedi Refactoring objects into renaming machines."""
 
-    def __init__(self, workspace: Workspace, refactoring: Refactoring) -> None:
-        self.workspace = workspace
+    def __init__(self, get_document: DocumentGetter, refactoring: Refactoring) -> None:
+        self.get_document = get_document
         self.refactoring = refactoring
 
     def lsp_renames(self) -> Iterator[RenameFile]:
@@ -65,50 +85,102 @@ class RefactoringConverter:
             )
 
     def lsp_text_document_edits(self) -> Iterator[TextDocumentEdit]:
-        """Get all text document edits."""
+        """Get all text document edits.
+
+        Files are converted in a process pool if many of them changed.
+        Files whose new code is invalid, or which fail to convert, are
+        left out.
+        """
         changed_files = self.refactoring.get_changed_files()
-        for path, changed_file in changed_files.items():
-            uri = path.as_uri()
-            document = self.workspace.get_document(uri)
+        documents = [self.get_document(path.as_uri()) for path in changed_files]
+        codes = [(document.source, changed_file.get_new_code())
+                 for document, changed_file in zip(documents, changed_files.values())]
+        for document, text_edits in zip(documents, _convert_files(codes)):
             version = 0 if document.version is None else document.version
-            text_edits = lsp_text_edits(document, changed_file)
             if text_edits:
                 yield TextDocumentEdit(
                     text_document=VersionedTextDocumentIdentifier(
-                        uri=uri,
+                        uri=document.uri,
                         version=version,
                     ),
                     edits=text_edits,
                 )
 
 
-_OPCODES_CHANGE = {"replace", "delete", "insert"}
+def _convert_file(old_code: str, new_code: str) -> List[EditTuple]:
+    try:
+        return code_edit_tuples(old_code, new_code)
+    except Exception:  # pylint: disable=broad-except
+        log.exception("Failed to convert a refactoring to text edits")
+        return []
+
+
+def _convert_files(codes: List[Tuple[str, str]]) -> List[List[TextEdit]]:
+    """Get the text edits of the old and new code of many files, in order.
+
+    The edits are computed as plain tuples, which are cheap to send back
+    from the pool, and turned into `TextEdit`s here.
+    """
+    size = sum(len(old_code) + len(new_code) for old_code, new_code in codes)
+    results = map_in_pool(_convert_file, codes, size / _CONVERT_RATE)
+    return [[_text_edit(*edit) for edit in edits] for edits in results]
+
+
+def lsp_rename_edit(document: Document, names: List[Name], new_name: str) -> TextDocumentEdit:
+    """Get the edit renaming some parso names of a document."""
+    return TextDocumentEdit(
+        text_document=VersionedTextDocumentIdentifier(
+            uri=document.uri,
+            version=0 if document.version is None else document.version,
+        ),
+        edits=[
+            TextEdit(
+                range=Range(
+                    start=Position(line=name.line - 1, character=name.column),
+                    end=Position(line=name.end_pos[0] - 1, character=name.end_pos[1]),
+                ),
+                new_text=new_name,
+            ) for name in names
+        ],
+    )
+
 
+_OPCODES_CHANGE = {"replace", "delete", "insert"}
 
-def lsp_text_edits(document: Document, changed_file: ChangedFile) -> List[TextEdit]:
-    """Take a jedi `ChangedFile` and convert to list of text edits.
 
-    Handles inserts, replaces, and deletions within a text file.
+def code_text_edits(old_code: str, new_code: str) -> List[TextEdit]:
+    """Get the text edits changing `old_code` to `new_code`.
 
-    Additionally, makes sure returned code is syntactically valid Python.
+    Returns no edits if the new code is not valid Python.
     """
-    new_code = changed_file.get_new_code()
+    return [_text_edit(*edit) for edit in code_edit_tuples(old_code, new_code)]
+
+
+def code_edit_tuples(old_code: str, new_code: str) -> List[EditTuple]:
+    """Same as `code_text_edits`, but as plain tuples."""
     if not is_valid_python(new_code):
         return []
 
-    old_code = document.source
     position_lookup = PositionLookup(old_code)
-    text_edits = []
+    edits = []
     for opcode in get_opcodes(old_code, new_code):
         if opcode.op in _OPCODES_CHANGE:
-            start = position_lookup.get(opcode.old_start)
-            end = position_lookup.get(opcode.old_end)
-            new_text = new_code[opcode.new_start:opcode.new_end]
-            text_edits.append(TextEdit(
-                range=Range(start=start, end=end),
-                new_text=new_text,
+            edits.append((
+                *position_lookup.get_line_character(opcode.old_start),
+                *position_lookup.get_line_character(opcode.old_end),
+                new_code[opcode.new_start:opcode.new_end],
             ))
-    return text_edits
+    return edits
+
+
+def _text_edit(start_line: int, start_character: int, end_line: int, end_character: int, new_text: str) -> TextEdit:
+    return TextEdit(
+        range=Range(
+            start=Position(line=start_line, character=start_character),
+            end=Position(line=end_line, character=end_character),
+        ),
+        new_text=new_text,
+    )
 
 
 class Opcode(NamedTuple):
@@ -130,10 +202,64 @@ class Opcode(NamedTuple):
     new_end: int
 
 
+def _line_offsets(lines: List[str]) -> List[int]:
+    """Get the offset of the start of every line, and of the end."""
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line))
+    return offsets
+
+
 def get_opcodes(old: str, new: str) -> List[Opcode]:
-    """Obtain typed opcodes from two files (old and new)"""
-    diff = difflib.SequenceMatcher(a=old, b=new)
-    return [Opcode(*opcode) for opcode in diff.get_opcodes()]
+    """Obtain typed opcodes from two files (old and new)
+
+    The lines of the files are diffed first, then the characters of the
+    changed lines only, which is much faster than diffing the characters of
+    the whole files.
+    """
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    old_offsets = _line_offsets(old_lines)
+    new_offsets = _line_offsets(new_lines)
+    opcodes = []
+    line_diff = difflib.SequenceMatcher(a=old_lines, b=new_lines, autojunk=False)
+    for op, old_line_start, old_line_end, new_line_start, new_line_end in line_diff.get_opcodes():
+        if op == "equal":
+            opcodes.append(
+                Opcode(op, old_offsets[old_line_start], old_offsets[old_line_end], new_offsets[new_line_start],
+                       new_offsets[new_line_end]))
+        elif op == "replace" and old_line_end - old_line_start == new_line_end - new_line_start:
+            # Lines replaced one by one, like by a rename, are diffed one by
+            # one too.
+            for old_line, new_line in zip(range(old_line_start, old_line_end), range(new_line_start, new_line_end)):
+                opcodes.extend(
+                    _get_char_opcodes(old, new, old_offsets[old_line], old_offsets[old_line + 1], new_offsets[new_line],
+                                      new_offsets[new_line + 1]))
+        else:
+            opcodes.extend(
+                _get_char_opcodes(old, new, old_offsets[old_line_start], old_offsets[old_line_end],
+                                  new_offsets[new_line_start], new_offsets[new_line_end]))
+    return opcodes
+
+
+def _get_char_opcodes(old: str, new: str, old_start: int, old_end: int, new_start: int,
+                      new_end: int) -> Iterator[Opcode]:
+    """Obtain the opcodes of a hunk of two files by diffing its characters.
+
+    The common prefix and suffix of the hunk are skipped before diffing.
+    """
+    old_hunk, new_hunk = old[old_start:old_end], new[new_start:new_end]
+    prefix = len(os.path.commonprefix([old_hunk, new_hunk]))
+    suffix = len(os.path.commonprefix([old_hunk[prefix:][::-1], new_hunk[prefix:][::-1]]))
+    if prefix:
+        yield Opcode("equal", old_start, old_start + prefix, new_start, new_start + prefix)
+    diff = difflib.SequenceMatcher(a=old_hunk[prefix:len(old_hunk) - suffix], b=new_hunk[prefix:len(new_hunk) - suffix])
+    old_start += prefix
+    new_start += prefix
+    for op, i1, i2, j1, j2 in diff.get_opcodes():
+        yield Opcode(op, old_start + i1, old_start + i2, new_start + j1, new_start + j2)
+    if suffix:
+        yield Opcode("equal", old_end - suffix, old_end, new_end - suffix, new_end)
 
 
 # pylint: disable=too-few-public-methods
@@ -152,6 +278,10 @@ class PositionLookup:
     def get(self, offset: int) -> Position:
         """Get the position in the file that corresponds to the given
         offset."""
-        line = bisect_right(self.line_starts, offset) - 1
-        character = offset - self.line_starts[line]
+        line, character = self.get_line_character(offset)
         return Position(line=line, character=character)
+
+    def get_line_character(self, offset: int) -> Tuple[int, int]:
+        """Same as `get`, but as a (line, character) tuple."""
+        line = bisect_right(self.line_starts, offset) - 1
+        return line, offset - self.line_starts[line]
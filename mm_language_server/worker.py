@@ -0,0 +1,146 @@
+"""Runs jedi work off the event loop.
+
+Jedi's inference state is not thread safe, so all jedi work runs on a
+single worker thread, in the order it was submitted. The event loop only
+snapshots the documents a job needs and awaits its result, so it keeps
+reading messages while a slow reference search runs.
+
+Jobs of requests can be cancelled, by the client or by a newer request
+superseding them. The job stops at the next safe point where it calls
+`check_cancelled`.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, TypeVar
+
+from pygls.workspace import Document
+
+T = TypeVar("T")
+
+log = logging.getLogger(__name__)
+
+
+class RequestCancelled(Exception):
+    """Raised at a safe point of a cancelled job."""
+
+
+class CancellationToken:
+    """The cancellation state of a job."""
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    def check(self) -> None:
+        """Raise `RequestCancelled` if the job was cancelled."""
+        if self._event.is_set():
+            raise RequestCancelled()
+
+
+_LOCAL = threading.local()
+
+
+def check_cancelled() -> None:
+    """Stop the current job if it was cancelled.
+
+    Does nothing outside of jobs, so it can be called from any code that
+    jobs may run.
+    """
+    token: Optional[CancellationToken] = getattr(_LOCAL, "token", None)
+    if token is not None:
+        token.check()
+
+
+def current_document(uri: str) -> Optional[Document]:
+    """Get the snapshot of a document taken for the current job."""
+    return current_documents().get(uri)
+
+
+def current_documents() -> Dict[str, Document]:
+    """Get the snapshots of all documents taken for the current job."""
+    return getattr(_LOCAL, "documents", {})
+
+
+def snapshot(document: Document) -> Document:
+    """Copy a document, so that edits applied by the event loop while a job
+    runs don't change it."""
+    return Document(document.uri, source=document.source, version=document.version)
+
+
+class Worker:
+    """The thread running jedi work."""
+
+    def __init__(self) -> None:
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="jedi")
+        # Only used on the event loop.
+        self._tokens: Dict[Hashable, CancellationToken] = {}
+
+    def submit(self, func: Callable[..., T], *args: Any) -> "concurrent.futures.Future[T]":
+        """Run a job which can't be cancelled, e.g. for a notification.
+
+        Nobody waits for these jobs, so their errors are logged.
+        """
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(_log_error)
+        return future
+
+    async def run(
+        self,
+        key: Optional[Hashable],
+        documents: Dict[str, Document],
+        func: Callable[..., T],
+        *args: Any,
+    ) -> T:
+        """Run a job of a request and wait for its result.
+
+        A job with the same `key` which is still running or waiting is
+        cancelled. `documents` are the snapshots `current_document` returns
+        to the job. The job is cancelled too if the awaiting task is, and a
+        cancelled job cancels the awaiting task.
+        """
+        token = CancellationToken()
+        if key is not None:
+            previous = self._tokens.get(key)
+            if previous is not None:
+                previous.cancel()
+            self._tokens[key] = token
+        future = self._executor.submit(self._call, token, documents, func, *args)
+        try:
+            return await asyncio.wrap_future(future)
+        except RequestCancelled:
+            raise asyncio.CancelledError() from None
+        except asyncio.CancelledError:
+            token.cancel()
+            raise
+        finally:
+            if key is not None and self._tokens.get(key) is token:
+                del self._tokens[key]
+
+    @staticmethod
+    def _call(token: CancellationToken, documents: Dict[str, Document], func: Callable[..., T], *args: Any) -> T:
+        token.check()
+        _LOCAL.token = token
+        _LOCAL.documents = documents
+        try:
+            return func(*args)
+        finally:
+            _LOCAL.token = None
+            _LOCAL.documents = {}
+
+
+def _log_error(future: "concurrent.futures.Future[Any]") -> None:
+    error = future.exception()
+    if error is not None:
+        log.error("Worker job failed", exc_info=error)
+
+
+WORKER = Worker()
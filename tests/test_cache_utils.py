@@ -0,0 +1,80 @@
+"""Tests of the bounded caches."""
+
+from mm_language_server import cache_utils
+from mm_language_server.cache_utils import LRUCache
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+def test_evicts_least_recently_used():
+    cache: LRUCache[str, int] = LRUCache("test_lru", maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_put_refreshes_existing_key():
+    cache: LRUCache[str, int] = LRUCache("test_lru", maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.put("a", 10)
+    cache.put("c", 3)
+    assert [key for key, _ in cache.items()] == ["a", "c"]
+    assert cache.get("a") == 10
+
+
+def test_expires_items_older_than_max_age(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(cache_utils, "time", clock)
+    cache: LRUCache[str, int] = LRUCache("test_age", max_age=10.0)
+    cache.put("a", 1)
+    clock.now = 10.0
+    assert cache.get("a") == 1
+    clock.now = 10.5
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_put_drops_expired_items(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(cache_utils, "time", clock)
+    cache: LRUCache[str, int] = LRUCache("test_age", max_age=10.0)
+    cache.put("old", 1)
+    clock.now = 5.0
+    cache.put("young", 2)
+    clock.now = 12.0
+    cache.put("new", 3)
+    assert [key for key, _ in cache.items()] == ["young", "new"]
+
+
+def test_evict_and_stats():
+    cache: LRUCache[tuple, int] = LRUCache("test_stats", maxsize=8)
+    for version in range(3):
+        cache.put(("uri", version), version)
+    assert cache.evict(lambda key: key[1] != 2) == 2
+    assert cache.get(("uri", 2)) == 2
+    assert cache.get(("uri", 0)) is None
+    # items() neither counts as hits nor refreshes items.
+    assert cache.items() == [(("uri", 2), 2)]
+    assert cache.stats() == {
+        "size": 1,
+        "maxsize": 8,
+        "hits": 1,
+        "misses": 1,
+        "hit_rate": 0.5,
+    }
+    assert cache_utils.cache_stats()["test_stats"] == cache.stats()
+    cache.clear()
+    assert cache.stats()["size"] == 0
+    assert cache.stats()["hits"] == 0
@@ -0,0 +1,86 @@
+"""Tests of checking configs against their bases and the registries."""
+
+import pytest
+
+from mm_language_server import config_checks
+from mm_language_server.config_checks import ConfigChecker
+from mm_language_server.registry_index import RegistryEntry, RegistryIndex
+
+MODELS = "mmcls.registry.MODELS"
+
+
+def _index(*keys):
+    """A new registry index object on every call, like after a rebuild."""
+    entries = {
+        key: RegistryEntry(MODELS, key, "mmcls.models", key, None, None)
+        for key in keys
+    }
+    return RegistryIndex("mmcls", {MODELS: entries}, frozenset([MODELS]))
+
+
+@pytest.fixture
+def config(tmp_path):
+    (tmp_path / "configs").mkdir()
+    base = tmp_path / "configs" / "base.py"
+    base.write_text("model = dict(type='ResNet', depth=50)\n")
+    path = tmp_path / "configs" / "child.py"
+    path.write_text(
+        "_base_ = ['./base.py']\n"
+        "model = dict(neck=dict(type='Neck'))\n"
+        "depth = '{{_base_.model.depth}}'\n"
+    )
+    return str(path)
+
+
+def test_result_id_is_stable_across_index_rebuilds(config, monkeypatch):
+    monkeypatch.setattr(config_checks, "load_index", lambda scope: _index())
+    checker = ConfigChecker()
+    result = checker.check(config, "mmcls", {})
+    assert result is not None
+    assert [diagnostic.message for diagnostic in result.diagnostics] == [
+        "'Neck' is not registered in mmcls.registry.MODELS"
+    ]
+    again = checker.check(config, "mmcls", {})
+    assert again is not None
+    assert again.result_id == result.result_id
+
+    # A rebuild registering other keys doesn't change the result either.
+    monkeypatch.setattr(
+        config_checks, "load_index", lambda scope: _index("ResNet")
+    )
+    rebuilt = checker.check(config, "mmcls", {})
+    assert rebuilt is not None
+    assert rebuilt.result_id == result.result_id
+
+    monkeypatch.setattr(
+        config_checks, "load_index", lambda scope: _index("ResNet", "Neck")
+    )
+    registered = checker.check(config, "mmcls", {})
+    assert registered is not None
+    assert registered.result_id != result.result_id
+    assert registered.diagnostics == []
+
+
+def test_result_id_changes_with_the_config_and_its_bases(config, monkeypatch):
+    monkeypatch.setattr(
+        config_checks, "load_index", lambda scope: _index("Neck")
+    )
+    checker = ConfigChecker()
+    result = checker.check(config, "mmcls", {})
+    assert result is not None
+    assert result.diagnostics == []
+
+    source = open(config, encoding="utf-8").read()
+    edited = checker.check(config, "mmcls", {config: source + "\n"})
+    assert edited is not None
+    assert edited.result_id != result.result_id
+
+    base = config.replace("child.py", "base.py")
+    base_edited = checker.check(
+        config, "mmcls", {base: "model = dict(type='ResNet')\n"}
+    )
+    assert base_edited is not None
+    assert base_edited.result_id != result.result_id
+    assert [diagnostic.message for diagnostic in base_edited.diagnostics] == [
+        "_base_ doesn't define 'model.depth'"
+    ]
@@ -0,0 +1,38 @@
+"""Tests of the cached jedi results of opened documents."""
+
+from pygls.lsp.types import MarkupKind
+from pygls.uris import from_fs_path
+from pygls.workspace import Document
+
+from mm_language_server import jedi_utils
+
+# The call comes before the definition, so the code up to its bracket
+# stays the same when the definition changes.
+CODE = """\
+def main():
+    foo(1, 2)
+
+
+def foo(a, b):
+    pass
+"""
+
+
+def _signature_labels(document, line, column):
+    help_ = jedi_utils.lsp_signature_help(
+        None, document, None, line, column, MarkupKind.PlainText
+    )
+    assert help_ is not None
+    return [signature.label for signature in help_.signatures], help_
+
+
+def test_signatures_are_not_reused_across_versions(tmp_path):
+    uri = from_fs_path(str(tmp_path / "a.py"))
+    labels, help_ = _signature_labels(Document(uri, CODE, 1), 2, 8)
+    assert labels == ["def foo(a, b)"]
+    assert help_.active_parameter == 0
+
+    new_code = CODE.replace("foo(a, b)", "foo(alpha, beta, gamma)")
+    labels, help_ = _signature_labels(Document(uri, new_code, 2), 2, 11)
+    assert labels == ["def foo(alpha, beta, gamma)"]
+    assert help_.active_parameter == 1
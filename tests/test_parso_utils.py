@@ -0,0 +1,58 @@
+"""Tests of the incremental parsing of opened documents."""
+
+from pygls.uris import from_fs_path
+from pygls.workspace import Document
+
+from mm_language_server import parso_utils
+
+CODE = """\
+def untouched():
+    return 1
+
+
+def edited():
+    return 2
+"""
+
+
+def _document(tmp_path, source, version):
+    return Document(from_fs_path(str(tmp_path / "a.py")), source, version)
+
+
+def test_reparses_only_changed_regions(tmp_path):
+    module = parso_utils.parse(None, _document(tmp_path, CODE, 1))
+    untouched = module.children[0]
+
+    new_code = CODE.replace("return 2", "return 3")
+    new_module = parso_utils.parse(None, _document(tmp_path, new_code, 2))
+    assert new_module.get_code() == new_code
+    # The diff parser updates the module in place and keeps the nodes of
+    # unchanged regions.
+    assert new_module is module
+    assert new_module.children[0] is untouched
+
+
+def test_reuses_module_of_same_version(tmp_path):
+    module = parso_utils.parse(None, _document(tmp_path, CODE, 1))
+    assert parso_utils.parse(None, _document(tmp_path, CODE, 1)) is module
+
+
+def test_registers_module_in_parser_cache(tmp_path):
+    document = _document(tmp_path, CODE, 1)
+    module = parso_utils.parse(None, document)
+    grammar = parso_utils.get_grammar(None, tmp_path / "a.py")
+    # Reparsing the same code through parso's cache finds our module.
+    cached = grammar.parse(CODE, path=tmp_path / "a.py", diff_cache=True)
+    assert cached is module
+
+    parso_utils.evict(None, document.uri)
+    other = grammar.parse(CODE, path=tmp_path / "a.py", diff_cache=True)
+    assert other is not module
+
+
+def test_does_not_cache_unversioned_documents(tmp_path):
+    module = parso_utils.parse(None, _document(tmp_path, CODE, 1))
+    unversioned = parso_utils.parse(None, _document(tmp_path, CODE, None))
+    assert unversioned is not module
+    assert unversioned.get_code() == CODE
+    assert parso_utils.parse(None, _document(tmp_path, CODE, 1)) is module
@@ -0,0 +1,55 @@
+"""Tests of looking up registered classes."""
+
+from mm_language_server.registry_index import (
+    PrefixTrie,
+    RegistryEntry,
+    RegistryIndex,
+)
+
+MODELS = "mmcls.registry.MODELS"
+
+
+def _entry(key):
+    return RegistryEntry(MODELS, key, "mmcls.models", key, None, None)
+
+
+def test_prefix_trie_finds_keys_by_prefix():
+    trie = PrefixTrie()
+    for key in ["ResNet", "ResNeXt", "ResNet", "ViT"]:
+        trie.insert(key, key)
+    assert sorted(trie.find("ResN")) == ["ResNeXt", "ResNet", "ResNet"]
+    assert trie.find("ResNet") == ["ResNet", "ResNet"]
+    assert sorted(trie.find("")) == ["ResNeXt", "ResNet", "ResNet", "ViT"]
+    assert trie.find("Swin") == []
+    assert trie.find("ResNet50") == []
+
+
+def test_registry_index_completes_sorted_keys():
+    index = RegistryIndex(
+        "mmcls",
+        {MODELS: {key: _entry(key) for key in ["ViT", "ResNet", "ResNeXt"]}},
+        frozenset([MODELS]),
+    )
+    assert [entry.key for entry in index.complete(MODELS, "Res")] == [
+        "ResNeXt",
+        "ResNet",
+    ]
+    assert [
+        entry.key
+        for entry in index.complete(MODELS, "resn", case_insensitive=True)
+    ] == ["ResNeXt", "ResNet"]
+    assert index.complete(MODELS, "resn") == []
+    assert index.complete("mmcls.registry.DATASETS", "") == []
+    assert index.complete(None, "") == []
+
+
+def test_registry_index_json_round_trip():
+    index = RegistryIndex(
+        "mmcls", {MODELS: {"ResNet": _entry("ResNet")}}, frozenset([MODELS])
+    )
+    loaded = RegistryIndex.from_json(index.to_json())
+    assert loaded.registries == index.registries
+    assert loaded.is_complete(MODELS)
+    assert not loaded.is_complete(None)
+    assert loaded.get(MODELS, "ResNet") == _entry("ResNet")
+    assert loaded.get(MODELS, "ViT") is None
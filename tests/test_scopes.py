@@ -0,0 +1,72 @@
+"""Tests of matching argument names against the patterns of a scope."""
+
+import re
+
+import pytest
+
+from mm_language_server.scopes import mmcls
+from mm_language_server.scopes.utils import (
+    PatternDispatcher,
+    PatternItem,
+    compile_pattern_list,
+)
+
+
+def _item(pattern):
+    return PatternItem(pattern=re.compile(pattern), registry=lambda: None)
+
+
+def _linear_match(pattern_list, full_arg_name):
+    matched = None
+    for item in pattern_list:
+        if item.pattern.match(full_arg_name):
+            matched = item
+    return matched
+
+
+def test_last_matching_item_wins():
+    general = _item(r"model\.(.*)\.type")
+    specific = _item(r"model\.backbone\.type")
+    unrelated = _item(r"optimizer\.type")
+    dispatcher = PatternDispatcher([general, specific, unrelated])
+    assert dispatcher.match("model.backbone.type") is specific
+    assert dispatcher.match("model.neck.type") is general
+    assert dispatcher.match("optimizer.type") is unrelated
+    assert dispatcher.match("scheduler.type") is None
+
+    reversed_dispatcher = PatternDispatcher([specific, general])
+    assert reversed_dispatcher.match("model.backbone.type") is general
+
+
+def test_empty_pattern_list():
+    assert PatternDispatcher([]).match("model.type") is None
+
+
+@pytest.mark.parametrize(
+    "full_arg_name",
+    [
+        "model.type",
+        "model.backbone.type",
+        "model.backbone.init_cfg.type",
+        "train_dataloader.dataset.type",
+        "train_dataloader.dataset.pipeline.type",
+        "val_dataloader.sampler.type",
+        "test_pipeline.type",
+        "unknown.type",
+    ],
+)
+def test_matches_like_a_linear_scan(full_arg_name):
+    dispatcher = compile_pattern_list("mmcls")
+    assert dispatcher is not None
+    assert dispatcher.match(full_arg_name) is _linear_match(
+        mmcls.pattern_list, full_arg_name
+    )
+
+
+def test_registry_name_without_import():
+    dispatcher = compile_pattern_list("mmcls")
+    assert dispatcher is not None
+    item = dispatcher.match("model.backbone.type")
+    assert item is not None
+    assert item.registry_name == "mmcls.registry.MODELS"
+    assert item.import_names == ["mmcls.models"]
@@ -0,0 +1,85 @@
+"""Tests of the text edits between two versions of a file."""
+
+from mm_language_server.text_edit_utils import (
+    code_edit_tuples,
+    code_text_edits,
+    get_opcodes,
+)
+
+OLD = """\
+import os
+
+
+def load(path):
+    with open(path) as f:
+        return f.read()
+
+
+print(load(os.getcwd()))
+"""
+
+
+def _apply(code, edits):
+    lines = code.splitlines(keepends=True)
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line))
+    # Edits don't overlap, so apply them from the last to keep offsets.
+    for start_line, start_char, end_line, end_char, new_text in sorted(
+        edits, reverse=True
+    ):
+        start = offsets[start_line] + start_char
+        end = offsets[end_line] + end_char
+        code = code[:start] + new_text + code[end:]
+    return code
+
+
+def test_opcodes_cover_both_files():
+    new = OLD.replace("load", "read_file").replace(
+        "    with", "    # x\n    with"
+    )
+    opcodes = get_opcodes(OLD, new)
+    assert opcodes[0].old_start == 0 and opcodes[0].new_start == 0
+    assert opcodes[-1].old_end == len(OLD)
+    assert opcodes[-1].new_end == len(new)
+    for previous, opcode in zip(opcodes, opcodes[1:]):
+        assert previous.old_end == opcode.old_start
+        assert previous.new_end == opcode.new_start
+    for op, old_start, old_end, new_start, new_end in opcodes:
+        if op == "equal":
+            assert OLD[old_start:old_end] == new[new_start:new_end]
+
+
+def test_rename_only_edits_renamed_characters():
+    new = OLD.replace("load", "read")
+    edits = code_edit_tuples(OLD, new)
+    assert _apply(OLD, edits) == new
+    # Lines replaced one by one are diffed by characters, so every edit
+    # stays on one line and only touches the renamed name.
+    assert [(edit[0], edit[2]) for edit in edits] == [(3, 3), (8, 8)]
+    assert all(len(edit[4]) <= len("read") for edit in edits)
+
+
+def test_edits_reproduce_new_code():
+    new = (
+        OLD.replace("import os\n", "import os\nimport sys\n")
+        .replace("        return f.read()\n", "        data = f.read()\n")
+        .replace("print(load(os.getcwd()))\n", "sys.exit(load(sys.argv[1]))\n")
+    )
+    edits = code_edit_tuples(OLD, new)
+    assert _apply(OLD, edits) == new
+    assert [
+        (
+            edit.range.start.line,
+            edit.range.start.character,
+            edit.range.end.line,
+            edit.range.end.character,
+            edit.new_text,
+        )
+        for edit in code_text_edits(OLD, new)
+    ] == edits
+
+
+def test_no_edits_for_invalid_code():
+    assert code_edit_tuples(OLD, OLD + "def broken(:\n") == []
+    assert code_edit_tuples(OLD, OLD) == []
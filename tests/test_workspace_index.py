@@ -0,0 +1,88 @@
+"""Tests of the symbol index of a workspace."""
+
+import os
+
+import pytest
+
+from mm_language_server.workspace_index import WorkspaceIndex, fuzzy_score
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    root = tmp_path / "workspace"
+    (root / "pkg").mkdir(parents=True)
+    (root / ".venv").mkdir()
+    (root / "pkg" / "models.py").write_text(
+        "class ResNet:\n    depth = 50\n\n\ndef build_model():\n    pass\n"
+    )
+    (root / "pkg" / "train.py").write_text(
+        "from pkg.models import build_model\n\nmodel = build_model()\n"
+    )
+    (root / ".venv" / "ignored.py").write_text("def build_model():\n")
+    return root
+
+
+def test_fuzzy_score():
+    assert fuzzy_score("rn", "ResNet") is not None
+    assert fuzzy_score("rsx", "ResNet") is None
+    assert fuzzy_score("", "ResNet") == 0
+    exact = fuzzy_score("resnet", "ResNet")
+    prefix = fuzzy_score("resnet", "ResNet50")
+    subsequence = fuzzy_score("resnet", "ResNeXt_net")
+    assert exact is not None and prefix is not None
+    assert subsequence is not None
+    assert exact > prefix > subsequence
+    # Characters at word boundaries score higher than inside words.
+    snake = fuzzy_score("rm", "res_model")
+    camel = fuzzy_score("rm", "resxModel")
+    inside = fuzzy_score("rm", "resxmodel")
+    assert snake is not None and camel is not None and inside is not None
+    assert snake == camel > inside
+
+
+def test_search(workspace):
+    index = WorkspaceIndex(str(workspace), [".venv"])
+    assert index.search("resnet") is None
+    index.build()
+    assert [symbol.full_name for symbol in index.search("resnet")] == [
+        "pkg.models.ResNet"
+    ]
+    assert [symbol.full_name for symbol in index.search("dep")] == [
+        "pkg.models.ResNet.depth"
+    ]
+    names = [symbol.full_name for symbol in index.search("model")]
+    assert names[0] == "pkg.train.model"
+    assert set(names) == {"pkg.train.model", "pkg.models.build_model"}
+    assert len(index.search("model", limit=1)) == 1
+
+
+def test_files_containing(workspace):
+    index = WorkspaceIndex(str(workspace), [".venv"])
+    assert index.files_containing("build_model") is None
+    index.build()
+    models = os.path.join(workspace, "pkg", "models.py")
+    train = os.path.join(workspace, "pkg", "train.py")
+    assert index.files_containing("build_model") == {models, train}
+    assert index.files_containing("ResNet") == {models}
+    assert index.files_containing("missing") == set()
+
+    with open(train, "w", encoding="utf-8") as f:
+        f.write("from pkg.models import ResNet\n")
+    index.update(train)
+    assert index.files_containing("build_model") == {models}
+    assert index.files_containing("ResNet") == {models, train}
+
+    os.remove(train)
+    index.update(train)
+    assert index.files_containing("ResNet") == {models}
+
+
+def test_loads_persisted_index(workspace):
+    index = WorkspaceIndex(str(workspace), [".venv"])
+    index.build()
+    loaded = WorkspaceIndex(str(workspace), [".venv"])
+    assert loaded.path == index.path
+    assert set(loaded._read()) == set(index._read())
+    loaded.build()
+    assert loaded.search("resnet") == index.search("resnet")